@@ -1,6 +1,7 @@
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine import make_url
 from alembic import context
 import os
 import sys
@@ -12,7 +13,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 load_dotenv()
 
 # Import your models
-from connection import Base
+from connection import Base, DATABASE_URL
 from models import User, Photo, Person, Face
 
 config = context.config
@@ -23,11 +24,11 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 def get_url():
-    DB_USER = os.getenv("DB_USER")
-    DB_PASSWORD = os.getenv("DB_PASSWORD")
-    DB_HOST = os.getenv("DB_HOST")
-    DB_NAME = os.getenv("DB_NAME")
-    return f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+    # The migrations use MySQL SQL such as UPDATE ... JOIN and now(); SQLite
+    # databases (tests, local benchmarks) are created with Base.metadata.create_all
+    if make_url(DATABASE_URL).get_backend_name() != "mysql":
+        raise RuntimeError(f"Alembic migrations only run against MySQL, not {DATABASE_URL}")
+    return DATABASE_URL
 
 def run_migrations_offline() -> None:
     url = get_url()
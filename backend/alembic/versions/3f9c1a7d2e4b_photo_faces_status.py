@@ -0,0 +1,25 @@
+"""photo faces status
+
+Revision ID: 3f9c1a7d2e4b
+Revises: b252e561d7fc
+Create Date: 2026-02-03 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1a7d2e4b'
+down_revision = 'b252e561d7fc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Photos uploaded before background detection already have their faces
+    op.add_column('photos', sa.Column('faces_status', sa.String(length=20), nullable=False, server_default='ready'))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'faces_status')
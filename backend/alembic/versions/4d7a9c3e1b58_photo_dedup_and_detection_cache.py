@@ -0,0 +1,46 @@
+"""photo dedup and detection cache
+
+Revision ID: 4d7a9c3e1b58
+Revises: e2b8f4a61c37
+Create Date: 2026-03-03 11:08:44.912407
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7a9c3e1b58'
+down_revision = 'e2b8f4a61c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing per-user duplicates keep their rows; only the oldest copy keeps the hash
+    op.execute("""
+        UPDATE photos p
+        JOIN (
+            SELECT user_id, content_hash, MIN(id) AS keep_id
+            FROM photos
+            WHERE content_hash IS NOT NULL
+            GROUP BY user_id, content_hash
+            HAVING COUNT(*) > 1
+        ) d ON p.user_id = d.user_id AND p.content_hash = d.content_hash AND p.id <> d.keep_id
+        SET p.content_hash = NULL
+    """)
+    op.create_index('ux_photos_user_content_hash', 'photos', ['user_id', 'content_hash'], unique=True)
+    op.create_table('detection_cache',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('model_version', sa.String(length=64), nullable=False),
+    sa.Column('faces_count', sa.Integer(), nullable=False),
+    sa.Column('detections', sa.Text(), nullable=False),
+    sa.Column('embeddings', sa.LargeBinary(length=16777216), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash', 'model_version')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('detection_cache')
+    op.drop_index('ux_photos_user_content_hash', table_name='photos')
@@ -0,0 +1,37 @@
+"""listing indexes and person stats
+
+Revision ID: 7e1d4b9a2c63
+Revises: 5c3e8a1f7d20
+Create Date: 2026-03-19 15:21:08.774129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1d4b9a2c63'
+down_revision = '5c3e8a1f7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_photos_user_created_id', 'photos', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_faces_person_photo', 'faces', ['person_id', 'photo_id'], unique=False)
+    op.add_column('persons', sa.Column('photo_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('persons', sa.Column('cover_face_id', sa.Integer(), nullable=True))
+
+    # Backfill from the faces already labelled; afterwards the app keeps both columns current
+    op.execute("""
+        UPDATE persons SET
+            photo_count = (SELECT COUNT(DISTINCT faces.photo_id) FROM faces WHERE faces.person_id = persons.id),
+            cover_face_id = (SELECT MIN(faces.id) FROM faces WHERE faces.person_id = persons.id)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('persons', 'cover_face_id')
+    op.drop_column('persons', 'photo_count')
+    op.drop_index('ix_faces_person_photo', table_name='faces')
+    op.drop_index('ix_photos_user_created_id', table_name='photos')
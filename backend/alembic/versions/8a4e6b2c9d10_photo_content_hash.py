@@ -0,0 +1,25 @@
+"""photo content hash
+
+Revision ID: 8a4e6b2c9d10
+Revises: 3f9c1a7d2e4b
+Create Date: 2026-02-10 14:27:05.630917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b2c9d10'
+down_revision = '3f9c1a7d2e4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows are hashed from their files by `python -m services.content_hash_backfill`
+    op.add_column('photos', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'content_hash')
@@ -0,0 +1,43 @@
+"""face clusters
+
+Revision ID: 9b2f6e8d4c15
+Revises: 4d7a9c3e1b58
+Create Date: 2026-03-10 09:52:31.407826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2f6e8d4c15'
+down_revision = '4d7a9c3e1b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('face_clusters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('centroid', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_face_clusters_id'), 'face_clusters', ['id'], unique=False)
+    op.create_index(op.f('ix_face_clusters_user_id'), 'face_clusters', ['user_id'], unique=False)
+    op.add_column('faces', sa.Column('cluster_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_faces_cluster_id'), 'faces', ['cluster_id'], unique=False)
+    op.create_foreign_key('fk_faces_cluster_id', 'faces', 'face_clusters', ['cluster_id'], ['id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_faces_cluster_id', 'faces', type_='foreignkey')
+    op.drop_index(op.f('ix_faces_cluster_id'), table_name='faces')
+    op.drop_column('faces', 'cluster_id')
+    op.drop_index(op.f('ix_face_clusters_user_id'), table_name='face_clusters')
+    op.drop_index(op.f('ix_face_clusters_id'), table_name='face_clusters')
+    op.drop_table('face_clusters')
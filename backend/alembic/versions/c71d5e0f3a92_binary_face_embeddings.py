@@ -0,0 +1,64 @@
+"""binary face embeddings
+
+Revision ID: c71d5e0f3a92
+Revises: 8a4e6b2c9d10
+Create Date: 2026-02-18 11:05:52.402716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d5e0f3a92'
+down_revision = '8a4e6b2c9d10'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+faces = sa.table(
+    'faces',
+    sa.column('id', sa.Integer),
+    sa.column('embedding_vector', sa.Text),
+    sa.column('embedding', sa.LargeBinary),
+)
+
+
+def _convert(source, target, convert) -> None:
+    """Copy one embedding column into another in id-ordered batches"""
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(faces.c.id, faces.c[source])
+            .where(faces.c.id > last_id)
+            .order_by(faces.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.execute(
+            faces.update().where(faces.c.id == sa.bindparam('face_id')).values({target: sa.bindparam('value')}),
+            [{'face_id': row[0], 'value': convert(row[1])} for row in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.add_column('faces', sa.Column('embedding', sa.LargeBinary(), nullable=True))
+    _convert('embedding_vector', 'embedding', lambda text: np.asarray(json.loads(text), dtype=np.float32).tobytes())
+    op.alter_column('faces', 'embedding', existing_type=sa.LargeBinary(), nullable=False)
+    op.drop_column('faces', 'embedding_vector')
+
+
+def downgrade() -> None:
+    op.add_column('faces', sa.Column('embedding_vector', sa.Text(), nullable=True))
+    _convert('embedding', 'embedding_vector', lambda blob: json.dumps(
+        np.frombuffer(blob, dtype=np.float16 if len(blob) == 1024 else np.float32).astype(float).tolist()
+    ))
+    op.alter_column('faces', 'embedding_vector', existing_type=sa.Text(), nullable=False)
+    op.drop_column('faces', 'embedding')
@@ -0,0 +1,24 @@
+"""photo content hash index
+
+Revision ID: e2b8f4a61c37
+Revises: c71d5e0f3a92
+Create Date: 2026-02-24 16:40:12.285311
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8f4a61c37'
+down_revision = 'c71d5e0f3a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Thumbnail URLs are looked up by content hash alone
+    op.create_index(op.f('ix_photos_content_hash'), 'photos', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_photos_content_hash'), table_name='photos')
@@ -0,0 +1,79 @@
+"""Recall@1 vs. latency of the face index backends on synthetic 512-d embeddings.
+
+Queries are noisy copies of stored identities, so recall@1 is measured against
+exact (flat) search results. Run from the backend folder:
+    python -m benchmarks.bench_ann_recall --persons 200000 --queries 1000
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from services.ann_index import build_ann_index, set_search_params
+
+NPROBE_VALUES = [1, 4, 8, 16, 32, 64, 128]
+EF_SEARCH_VALUES = [16, 32, 64, 128, 256]
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def synthetic_embeddings(persons: int, queries: int, dim: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed)
+    base = normalize(rng.standard_normal((persons, dim), dtype=np.float32))
+    picked = rng.integers(0, persons, size=queries)
+    noisy = normalize(base[picked] + noise * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim))
+    return base, noisy
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray):
+    """Return (recall@1, mean ms per single query, queries/sec when batched)"""
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query.reshape(1, -1), 1)
+    single_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    _, ids = index.search(queries, 1)
+    batched_qps = len(queries) / (time.perf_counter() - start)
+
+    return float((ids[:, 0] == truth).mean()), single_ms, batched_qps
+
+def report(label: str, result):
+    recall, single_ms, batched_qps = result
+    print(f"{label:<28} recall@1={recall:6.4f}  {single_ms:8.3f} ms/query  {batched_qps:10.0f} q/s batched")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--noise", type=float, default=0.6, help="Query noise relative to the unit embedding")
+    parser.add_argument("--backends", default="ivf_flat,ivf_pq,hnsw")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base, queries = synthetic_embeddings(args.persons, args.queries, args.dim, args.noise, args.seed)
+    ids = np.arange(args.persons, dtype=np.int64)
+
+    flat = faiss.IndexIDMap2(faiss.IndexFlatL2(args.dim))
+    flat.add_with_ids(base, ids)
+    _, truth = flat.search(queries, 1)
+    truth = truth[:, 0]
+    report("flat (exact)", measure(flat, queries, truth))
+
+    for backend in args.backends.split(","):
+        start = time.perf_counter()
+        index = build_ann_index(backend, base, ids)
+        print(f"\n{backend}: built in {time.perf_counter() - start:.1f}s")
+
+        if backend == "hnsw":
+            for ef_search in EF_SEARCH_VALUES:
+                set_search_params(index, ef_search=ef_search)
+                report(f"  efSearch={ef_search}", measure(index, queries, truth))
+        else:
+            for nprobe in NPROBE_VALUES:
+                set_search_params(index, nprobe=nprobe)
+                report(f"  nprobe={nprobe}", measure(index, queries, truth))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Measure per-request authentication overhead with and without the token cache.
+
+Uses a throwaway signing key, so no .env or database is needed; the
+database lookup that a cache miss adds on top is not included. Run from
+the backend folder:
+    python -m benchmarks.bench_auth --requests 20000
+"""
+import argparse
+import os
+import time
+
+from jwcrypto import jwk
+
+# Must be set before utils.auth reads it
+os.environ["JWT_KEY"] = jwk.JWK.generate(kty="oct", size=256).export()
+
+from utils import auth
+
+def microseconds_per_call(run, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        run()
+    return (time.perf_counter() - start) / count * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = auth.create_access_token({"sub": "bench@example.com"})
+    claims = auth.decode_access_token(token)
+    principal = auth.CurrentUser(1, "bench@example.com", "Bench", True, None)
+    auth._cache_principal(token, principal, claims["exp"])
+
+    def reparse_and_verify():
+        # What every request used to do before the database query
+        auth.jwt.JWT(jwt=token, key=auth.jwk.JWK.from_json(auth.JWT_KEY))
+
+    results = [
+        ("parse key + verify", microseconds_per_call(reparse_and_verify, args.requests)),
+        ("verify only", microseconds_per_call(lambda: auth.decode_access_token(token), args.requests)),
+        ("cache hit", microseconds_per_call(lambda: auth._cached_principal(token), args.requests)),
+    ]
+    baseline = results[0][1]
+    for name, micros in results:
+        print(f"{name:>20}: {micros:9.2f} us/request ({baseline / micros:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compare single-image and batched face detection throughput.
+
+Run from the backend folder:
+    python -m benchmarks.bench_batch_detection ./uploads --max-images 128
+"""
+import argparse
+import glob
+import os
+import time
+
+from services.gallery_face_service import GalleryFaceService
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+IMAGE_PATTERNS = ["*.jpg", "*.jpeg", "*.png", "*.webp"]
+
+def images_per_second(run, count: int) -> float:
+    start = time.perf_counter()
+    run()
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", help="Folder with sample photos")
+    parser.add_argument("--max-images", type=int, default=64)
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.image_dir, pattern)))
+    paths = paths[:args.max_images]
+    if not paths:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    service = GalleryFaceService(load_index=False)
+    batched = service._detector_supports_batch()
+    print(f"{len(paths)} images, detector batching {'enabled' if batched else 'unavailable (recognition still batched)'}")
+
+    # Warm up ONNX sessions so the first measurement isn't skewed
+    service.detect_faces_in_photos(paths[:2])
+
+    single = images_per_second(lambda: [service.detect_faces_in_photo(p) for p in paths], len(paths))
+    print(f"{'single loop':>12}: {single:8.2f} images/sec")
+
+    for batch_size in BATCH_SIZES:
+        rate = images_per_second(lambda: service.detect_faces_in_photos(paths, batch_size=batch_size), len(paths))
+        print(f"{'batch ' + str(batch_size):>12}: {rate:8.2f} images/sec ({rate / single:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Load the photo-listing query concurrently and report latency and pool waits.
+
+Defaults to a throwaway SQLite file, so MySQL is not needed; set
+DATABASE_URL (and DB_ASYNC_DRIVER) to measure a real server instead. Run
+from the backend folder:
+    python -m benchmarks.bench_db_pool --photos 5000 --requests 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_db_path = os.path.join(tempfile.gettempdir(), "smartgallery_bench.db")
+# Must be set before connection creates the engines
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+
+from sqlalchemy import select
+from sqlalchemy.orm import defer, joinedload, selectinload
+
+from connection import Base, DATABASE_URL, engine, fetch_all, get_read_db, pool_stats, SessionLocal
+from models import Face, Photo, User
+
+PAGE_SIZE = 50
+
+def seed(photos: int) -> int:
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == "bench@example.com").first()
+        if user is None:
+            user = User(email="bench@example.com", full_name="Bench", hashed_password="-", is_verified=True)
+            db.add(user)
+            db.flush()
+
+        existing = db.query(Photo).filter(Photo.user_id == user.id).count()
+        for i in range(existing, photos):
+            photo = Photo(user_id=user.id, filename=f"{i}.jpg", original_name=f"{i}.jpg",
+                          file_path=f"./uploads/{i}.jpg", file_size=1, faces_count=1, faces_status="ready")
+            photo.faces.append(Face(bbox_x=0, bbox_y=0, bbox_width=10, bbox_height=10, confidence=0.9, embedding=b"\0" * 2048))
+            db.add(photo)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+async def list_page(user_id: int) -> float:
+    start = time.perf_counter()
+    sessions = get_read_db()
+    db = await sessions.__anext__()
+    try:
+        await fetch_all(db, select(Photo).where(Photo.user_id == user_id).options(
+            selectinload(Photo.faces).options(defer(Face.embedding), joinedload(Face.person))
+        ).order_by(Photo.created_at.desc(), Photo.id.desc()).limit(PAGE_SIZE), scalars=True)
+    finally:
+        await sessions.aclose()
+    return time.perf_counter() - start
+
+async def run(user_id: int, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await list_page(user_id)
+
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(one() for _ in range(requests))))
+    elapsed = time.perf_counter() - start
+
+    print(f"{requests / elapsed:8.1f} pages/sec, p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"pool: {pool_stats()}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"Database: {DATABASE_URL}")
+    user_id = seed(args.photos)
+    asyncio.run(run(user_id, args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main()
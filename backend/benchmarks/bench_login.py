@@ -0,0 +1,68 @@
+"""Measure login throughput and event loop stalls during a burst of password checks.
+
+Compares verifying inline on the event loop (the old behaviour) with the
+bounded password executor, using the Argon2 settings from the environment.
+Run from the backend folder:
+    python -m benchmarks.bench_login --logins 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from utils import auth
+
+async def max_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Longest delay past a scheduled wake-up while the burst runs"""
+    lag = 0.0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - expected)
+    return lag
+
+async def burst(check, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    shed = 0
+
+    async def one():
+        nonlocal shed
+        async with semaphore:
+            try:
+                await check()
+            except HTTPException:
+                shed += 1
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(max_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return (logins - shed) / elapsed, await lag_task, shed
+
+async def main_async(args):
+    stored = auth.hash_password("correct horse battery staple")
+    print(f"argon2 time_cost={auth.ARGON2_TIME_COST} memory_cost={auth.ARGON2_MEMORY_COST}KiB "
+          f"parallelism={auth.ARGON2_PARALLELISM}, {auth.PASSWORD_HASH_WORKERS} hash workers")
+
+    async def inline():
+        auth.verify_and_update_password("correct horse battery staple", stored)
+
+    async def executor():
+        await auth.run_password_hasher(auth.verify_and_update_password, "correct horse battery staple", stored)
+
+    for name, check in [("inline", inline), ("executor", executor)]:
+        rate, lag, shed = await burst(check, args.logins, args.concurrency)
+        print(f"{name:>9}: {rate:8.1f} logins/sec, max event loop stall {lag * 1000:7.1f} ms, {shed} shed")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
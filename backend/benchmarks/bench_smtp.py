@@ -0,0 +1,55 @@
+"""Send through a local aiosmtpd stand-in, with a kept-alive connection and one per email.
+
+Needs `pip install aiosmtpd`; no real mail server, database or credentials
+are involved. Checks every message arrived and compares throughput. Run from
+the backend folder:
+    python -m benchmarks.bench_smtp --emails 200
+"""
+import argparse
+import time
+
+from aiosmtpd.controller import Controller
+
+from utils.email import SMTPConnection, build_message, otp_email
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+def send_all(count: int, pooled: bool, port: int) -> float:
+    subject, body = otp_email("123456")
+    connection = SMTPConnection("127.0.0.1", port, starttls=False, username="", password="")
+    start = time.perf_counter()
+    for i in range(count):
+        connection.send(build_message(f"user{i}@example.com", subject, body, from_email="noreply@example.com"))
+        if not pooled:
+            connection.close()
+    connection.close()
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        per_email = send_all(args.emails, pooled=False, port=args.port)
+        pooled = send_all(args.emails, pooled=True, port=args.port)
+    finally:
+        controller.stop()
+
+    print(f"connection per email: {per_email:8.1f} emails/sec")
+    print(f"  kept-alive session: {pooled:8.1f} emails/sec ({pooled / per_email:.1f}x)")
+    if handler.received != 2 * args.emails:
+        raise SystemExit(f"Server received {handler.received} of {2 * args.emails} emails")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,15 +17,135 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_NAME = os.getenv("DB_NAME")
 
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# Set to e.g. sqlite:///./smartgallery.db to benchmark locally without MySQL;
+# such databases get their tables from create_all, since the migrations are MySQL-only
+DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# aiomysql or asyncmy (aiosqlite for SQLite) turns on AsyncSession for the hot read routes
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER")
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Below MySQL's wait_timeout, so the server never closes a connection we still hold
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+class PoolMetrics:
+    """Checkouts and time spent waiting for a pooled connection, including opening new ones"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool) -> dict:
+        with self.lock:
+            attempts = self.checkouts + self.timeouts
+            stats = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3)
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return stats
+
+pool_metrics = {'sync': PoolMetrics(), 'async': PoolMetrics()}
+
+class _TimedPool:
+    """Pool mixin that records how long each checkout waited"""
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    metrics = pool_metrics['sync']
+
+class TimedAsyncPool(_TimedPool, AsyncAdaptedQueuePool):
+    metrics = pool_metrics['async']
+
+def _engine_options(url) -> dict:
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
+    if url.get_backend_name() == "sqlite":
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+_url = make_url(DATABASE_URL)
+engine = create_engine(_url, poolclass=TimedQueuePool, **_engine_options(_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC_DRIVER:
+    try:
+        _async_url = _url.set(drivername=f"{_url.get_backend_name()}+{DB_ASYNC_DRIVER}")
+        async_engine = create_async_engine(_async_url, poolclass=TimedAsyncPool, **_engine_options(_async_url))
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    except Exception as e:
+        print(f"⚠ Async database driver {DB_ASYNC_DRIVER} not available, using the sync engine: {e}")
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_read_db():
+    """Session for async read routes: an AsyncSession when DB_ASYNC_DRIVER is set, else a sync one.
+
+    Query it through fetch_all so both kinds stay off the event loop.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+async def fetch_all(db, statement, scalars: bool = False) -> list:
+    """Run a select and load every row, including eager-loaded relationships"""
+    if isinstance(db, AsyncSession):
+        result = await db.execute(statement)
+        return list(result.scalars() if scalars else result)
+
+    def run():
+        result = db.execute(statement)
+        return list(result.scalars() if scalars else result)
+    return await run_in_threadpool(run)
+
+def pool_stats() -> dict:
+    stats = {'sync': pool_metrics['sync'].snapshot(engine.pool)}
+    if async_engine is not None:
+        stats['async'] = pool_metrics['async'].snapshot(async_engine.pool)
+    return stats
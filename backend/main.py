@@ -1,9 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from connection import engine, Base
+from connection import async_engine, pool_stats
 from routes import auth, user, gallery
+from services.email_outbox import email_sender
+from services.index_rebuild import rebuild_all
+import asyncio
 import os
+import threading
 
 app = FastAPI(title="SmartGallery AI API")
 
@@ -28,6 +32,52 @@ app.include_router(gallery.router)
 async def root():
     return {"message": "SmartGallery AI API is running"}
 
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: face recognition is loaded and the detection workers are warm"""
+    if gallery.warmup_status['status'] != 'ready':
+        response.status_code = 503
+    return gallery.warmup_status
+
+@app.get("/metrics/db")
+async def db_pool_metrics():
+    """Connection pool usage and checkout waits of this worker"""
+    return pool_stats()
+
+def warm_up(loop: asyncio.AbstractEventLoop):
+    gallery.warm_up(loop)
+    # Off by default: the snapshot plus log is already consistent after a clean restart
+    if os.getenv("FACE_INDEX_REBUILD_ON_STARTUP", "false").lower() == "true" and gallery.face_service:
+        rebuild_all(gallery.face_service.index_manager)
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Accept requests right away; /ready turns 200 once the models are loaded
+    threading.Thread(target=warm_up, args=(asyncio.get_running_loop(),), daemon=True).start()
+
+@app.on_event("startup")
+def start_email_sender():
+    email_sender.start()
+
+@app.on_event("shutdown")
+def shutdown_detection_workers():
+    if gallery.detection_queue:
+        gallery.detection_queue.shutdown()
+
+@app.on_event("shutdown")
+def stop_email_sender():
+    email_sender.stop()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
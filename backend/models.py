@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, LargeBinary, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from connection import Base
@@ -24,13 +24,21 @@ class Photo(Base):
     original_name = Column(String(255), nullable=False)
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=True, index=True)
     width = Column(Integer, nullable=True)
     height = Column(Integer, nullable=True)
     faces_count = Column(Integer, default=0)
+    faces_status = Column(String(20), nullable=False, default="pending")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="photos")
     faces = relationship("Face", back_populates="photo", cascade="all, delete-orphan")
+    
+    # A user holds each distinct file at most once; the gallery pages on (user_id, created_at, id)
+    __table_args__ = (
+        Index('ux_photos_user_content_hash', 'user_id', 'content_hash', unique=True),
+        Index('ix_photos_user_created_id', 'user_id', 'created_at', 'id'),
+    )
 
 class Person(Base):
     __tablename__ = "persons"
@@ -39,6 +47,10 @@ class Person(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String(255), nullable=False)
     face_embedding_id = Column(String(255), unique=True, nullable=False)
+    # Maintained by refresh_person_stats whenever faces move, so listings never count
+    photo_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Not a foreign key: faces already reference persons, and a stale id is refreshed on the next write
+    cover_face_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -51,17 +63,67 @@ class Face(Base):
     id = Column(Integer, primary_key=True, index=True)
     photo_id = Column(Integer, ForeignKey("photos.id"), nullable=False)
     person_id = Column(Integer, ForeignKey("persons.id"), nullable=True)
+    cluster_id = Column(Integer, ForeignKey("face_clusters.id"), nullable=True, index=True)
     bbox_x = Column(Float, nullable=False)
     bbox_y = Column(Float, nullable=False)
     bbox_width = Column(Float, nullable=False)
     bbox_height = Column(Float, nullable=False)
     confidence = Column(Float, nullable=False)
-    embedding_vector = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
     is_verified = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     photo = relationship("Photo", back_populates="faces")
     person = relationship("Person", back_populates="faces")
+    cluster = relationship("FaceCluster", back_populates="faces")
+    
+    # Photos of a person, and the photo-count refresh, read this index only
+    __table_args__ = (
+        Index('ix_faces_person_photo', 'person_id', 'photo_id'),
+    )
+
+class FaceCluster(Base):
+    __tablename__ = "face_clusters"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Faces folded in so far, used to weight incremental centroid updates
+    size = Column(Integer, nullable=False, default=0)
+    centroid = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    faces = relationship("Face", back_populates="cluster")
+
+class DetectionCache(Base):
+    __tablename__ = "detection_cache"
+    
+    content_hash = Column(String(64), primary_key=True)
+    model_version = Column(String(64), primary_key=True)
+    faces_count = Column(Integer, nullable=False)
+    # JSON list of {bbox, confidence}; embeddings holds the matching float32 rows back to back
+    detections = Column(Text, nullable=False)
+    embeddings = Column(LargeBinary(length=16 * 1024 * 1024), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    to_address = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    # pending -> sending (leased by a sender until next_attempt_at) -> sent | failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
 
 User.photos = relationship("Photo", back_populates="user")
 User.persons = relationship("Person", back_populates="user")
\ No newline at end of file
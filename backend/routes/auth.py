@@ -3,8 +3,8 @@ from sqlalchemy.orm import Session
 from connection import get_db
 from models import User
 from schemas.user import UserRegister, UserLogin, VerifyOTP, UserResponse, Token
-from utils.auth import hash_password, verify_password, create_access_token, generate_otp
-from utils.email import send_otp_email
+from utils.auth import hash_password, verify_and_update_password, run_password_hasher, create_access_token, generate_otp
+from services.email_outbox import email_sender, queue_otp_email
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -17,20 +17,21 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     
     # Generate OTP
     otp_code = generate_otp()
+    hashed_password = await run_password_hasher(hash_password, user_data.password)
     
     # Create user
     user = User(
         email=user_data.email,
         full_name=user_data.full_name,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=hashed_password,
         otp_code=otp_code
     )
     
     db.add(user)
+    # Queued in the same transaction, so the OTP email is sent if and only if the user exists
+    queue_otp_email(db, user_data.email, otp_code)
     db.commit()
-    
-    # Send OTP email
-    send_otp_email(user_data.email, otp_code)
+    email_sender.notify()
     
     return {"message": "Registration successful. Please check your email for OTP."}
 
@@ -49,9 +50,18 @@ async def verify_otp(otp_data: VerifyOTP, db: Session = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login(login_data: UserLogin, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    valid, new_hash = await run_password_hasher(verify_and_update_password, login_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    if new_hash:
+        # Argon2 parameters changed since this password was stored
+        user.hashed_password = new_hash
+        db.commit()
+    
     if not user.is_verified:
         raise HTTPException(status_code=401, detail="Email not verified")
     
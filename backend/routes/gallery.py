@@ -1,120 +1,181 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, UploadFile, File
+from fastapi.responses import FileResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload, joinedload, defer
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
+from datetime import datetime
+import asyncio
+import base64
+import hashlib
 import os
+import tarfile
 import uuid
-import json
+import zipfile
 import numpy as np
-from PIL import Image
 
-from connection import get_db
-from models import User, Photo, Person, Face
+from connection import fetch_all, get_db, get_read_db
+from models import Photo, Person, Face, FaceCluster
 from schemas.gallery import *
-from services.gallery_face_service import GalleryFaceService
-from utils.auth import get_current_user
+from services.face_detection_queue import FaceDetectionQueue
+from services.face_clustering import run_clustering_job
+from services.face_rematch import schedule_rematch, run_rematch_job
+from services.index_rebuild import run_rebuild_job
+from services.job_registry import job_registry
+from services.person_stats import lock_persons, refresh_person_stats
+from services.derivative_service import derivative_service, DERIVATIVE_FORMATS
+from utils.auth import CurrentUser, get_current_user
+from utils.embeddings import decode_embedding
+from utils.image_loader import decode_image
+from utils.uploads import save_stream, iter_archive_images, take, write_blob
 
 router = APIRouter(prefix="/gallery", tags=["gallery"])
 
-# Try to initialize face service, but don't fail if it errors
-try:
-    face_service = GalleryFaceService()
-    print("✓ Face recognition service initialized")
-except Exception as e:
-    print(f"⚠ Face recognition not available: {e}")
-    face_service = None
+# Set by warm_up() in the background, so importing this module stays cheap
+face_service = None
+detection_queue = None
+warmup_status = {'status': 'starting', 'error': None}
+
+def warm_up(loop: Optional[asyncio.AbstractEventLoop] = None):
+    """Load the face index and start the detection workers; runs off the event loop at startup.
+    
+    With the server's event loop given, photos whose detection never finished
+    are queued again once the workers are ready.
+    """
+    global face_service, detection_queue
+    try:
+        # Imported here: InsightFace and ONNX Runtime take seconds to import
+        from services.gallery_face_service import GalleryFaceService
+        face_service = GalleryFaceService()
+        detection_queue = FaceDetectionQueue(face_service)
+        print("✓ Face recognition service initialized")
+        
+        detection_queue.warm_up()
+        warmup_status['status'] = 'ready'
+        print(f"✓ {detection_queue.workers} face detection workers ready")
+        
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(_requeue_unfinished(), loop)
+    except Exception as e:
+        print(f"⚠ Face recognition not available: {e}")
+        # Photos uploaded meanwhile stay pending for the next successful start to queue
+        warmup_status.update(status='unavailable', error=str(e))
+
+async def _requeue_unfinished():
+    try:
+        job_ids = await detection_queue.requeue_unfinished()
+        if job_ids:
+            print(f"✓ Re-queued unfinished face detection in {len(job_ids)} jobs")
+    except Exception as e:
+        print(f"⚠ Could not re-queue unfinished face detection: {e}")
+
+def _initial_faces_status() -> str:
+    """Status of a new photo: uploads during warm-up wait as pending and are queued once it finishes"""
+    if detection_queue or warmup_status['status'] == 'starting':
+        return 'pending'
+    return 'skipped'
 
 UPLOAD_DIR = "./uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+BULK_BATCH_SIZE = 32
+MAX_PAGE_SIZE = 200
+MAX_BULK_ASSIGN = 10000
+# Derivative URLs change whenever content changes, so clients may cache them forever
+DERIVATIVE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
 @router.post("/upload")
 async def upload_photo(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Upload photo and detect faces"""
+    """Upload photo and queue face detection"""
     try:
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(400, "File must be an image")
         
-        # Save file
-        file_ext = os.path.splitext(file.filename)[1]
-        filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
         content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        content_hash = hashlib.sha256(content).hexdigest()
+        
+        existing = db.query(Photo).filter(
+            Photo.user_id == current_user.id,
+            Photo.content_hash == content_hash
+        ).first()
+        if existing:
+            return _duplicate_upload(existing)
         
-        # Get image dimensions
+        # Decode once; dimensions, detection and thumbnails all reuse this buffer
         try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-        except:
-            width, height = None, None
+            decoded = await run_in_threadpool(decode_image, content)
+            detection_input = await run_in_threadpool(decoded.detection_input)
+        except Exception as e:
+            print(f"Could not decode {file.filename}, detection will read the saved file: {e}")
+            decoded, detection_input = None, None
         
-        # Detect faces
-        faces_data = []
-        if face_service:
-            try:
-                faces_data = face_service.detect_faces_in_photo(file_path)
-            except Exception as face_err:
-                print(f"Face detection error: {face_err}")
-        else:
-            print("Face service not available, skipping face detection")
+        # No awaits from here until submit(), so the capacity check can't go stale
+        if detection_queue and not detection_queue.has_capacity():
+            raise HTTPException(503, "Face detection queue is full, please retry shortly", headers={"Retry-After": "5"})
         
-        # Create photo record
+        # Save file, identical content from any user shares one copy
+        filename, file_path = write_blob(content, content_hash, file.filename, UPLOAD_DIR)
+        
+        width, height = (decoded.width, decoded.height) if decoded else (None, None)
+        
+        # Create photo record, faces are filled in by the detection workers
         photo = Photo(
             user_id=current_user.id,
             filename=filename,
             original_name=file.filename,
             file_path=file_path,
             file_size=len(content),
+            content_hash=content_hash,
             width=width,
             height=height,
-            faces_count=len(faces_data)
+            faces_count=0,
+            faces_status=_initial_faces_status()
         )
         db.add(photo)
-        db.flush()
+        try:
+            db.commit()
+        except IntegrityError:
+            # The same file arrived in a concurrent request
+            db.rollback()
+            existing = db.query(Photo).filter(
+                Photo.user_id == current_user.id,
+                Photo.content_hash == content_hash
+            ).first()
+            if not existing:
+                raise
+            return _duplicate_upload(existing)
         
-        # Create face records
-        faces = []
-        if face_service:
-            for face_data in faces_data:
-                try:
-                    embedding = np.array(face_data['embedding'])
-                    person_match = face_service.search_person(embedding)
-                    
-                    face = Face(
-                        photo_id=photo.id,
-                        person_id=person_match['person_id'] if person_match else None,
-                        bbox_x=face_data['bbox']['x'],
-                        bbox_y=face_data['bbox']['y'],
-                        bbox_width=face_data['bbox']['width'],
-                        bbox_height=face_data['bbox']['height'],
-                        confidence=face_data['confidence'],
-                        embedding_vector=json.dumps(face_data['embedding']),
-                        is_verified=bool(person_match)
-                    )
-                    db.add(face)
-                    faces.append(face)
-                except Exception as face_err:
-                    print(f"Face record error: {face_err}")
-                    continue
+        if decoded:
+            background_tasks.add_task(derivative_service.generate_thumbnails_from_image, decoded.image, photo.content_hash)
+        else:
+            background_tasks.add_task(derivative_service.generate_thumbnails, file_path, photo.content_hash)
         
-        db.commit()
+        job_id = None
+        if detection_queue:
+            if decoded:
+                source, scale = detection_input, decoded.scale
+            else:
+                source, scale = file_path, 1.0
+            job_id = detection_queue.submit(current_user.id, [(photo.id, source, scale)])
+        elif photo.faces_status == 'pending':
+            print("Face service still warming up, detection is queued once it is ready")
+        else:
+            print("Face service not available, skipping face detection")
         
         return {
             'id': photo.id,
             'filename': filename,
-            'faces_count': len(faces_data),
-            'faces': [{
-                'id': f.id,
-                'bbox': {'x': f.bbox_x, 'y': f.bbox_y, 'width': f.bbox_width, 'height': f.bbox_height},
-                'confidence': f.confidence,
-                'person_id': f.person_id,
-                'is_verified': f.is_verified
-            } for f in faces]
+            'faces_count': 0,
+            'faces': [],
+            'faces_status': photo.faces_status,
+            'job_id': job_id,
+            'duplicate': False
         }
     except HTTPException:
         raise
@@ -125,23 +186,239 @@ async def upload_photo(
         print(f"Upload error: {error_detail}")
         raise HTTPException(500, f"Upload failed: {str(e)}")
 
+def _duplicate_upload(photo: Photo) -> dict:
+    """Upload response for a file the user already has"""
+    return {
+        'id': photo.id,
+        'filename': photo.filename,
+        'faces_count': photo.faces_count,
+        'faces': [],
+        'faces_status': photo.faces_status,
+        'job_id': None,
+        'duplicate': True
+    }
+
+def _insert_batch(saved: List[dict], db: Session, user_id: int) -> dict:
+    """Insert one batch of saved files in a single transaction; runs in the threadpool.
+    
+    Files the user already has, or that repeat within the batch, are reported
+    as duplicates of the existing photo instead of being inserted again.
+    """
+    existing = {p.content_hash: p for p in db.query(Photo).filter(
+        Photo.user_id == user_id,
+        Photo.content_hash.in_({item['content_hash'] for item in saved})
+    ).all()}
+    
+    fresh, repeated = {}, []
+    for item in saved:
+        if item['content_hash'] in existing or item['content_hash'] in fresh:
+            repeated.append(item)
+        else:
+            fresh[item['content_hash']] = item
+    
+    photos = [Photo(
+        user_id=user_id,
+        filename=item['filename'],
+        original_name=item['original_name'],
+        file_path=item['file_path'],
+        file_size=item['file_size'],
+        content_hash=item['content_hash'],
+        width=item['width'],
+        height=item['height'],
+        faces_count=0,
+        faces_status=_initial_faces_status()
+    ) for item in fresh.values()]
+    db.add_all(photos)
+    db.flush()
+    
+    queued = [(p.id, p.file_path, 1.0) for p in photos]
+    summary = [{
+        'id': p.id,
+        'filename': p.filename,
+        'original_name': p.original_name,
+        'faces_status': p.faces_status,
+        'duplicate': False
+    } for p in photos]
+    
+    by_hash = {**existing, **{p.content_hash: p for p in photos}}
+    summary.extend({
+        'id': by_hash[item['content_hash']].id,
+        'filename': item['filename'],
+        'original_name': item['original_name'],
+        'faces_status': by_hash[item['content_hash']].faces_status,
+        'duplicate': True
+    } for item in repeated)
+    db.commit()
+    
+    return {'queued': queued, 'fresh': list(fresh.values()), 'photos': summary}
+
+async def _ingest_batch(saved: List[dict], db: Session, user_id: int, background_tasks: BackgroundTasks) -> dict:
+    """Insert one batch of saved files and queue detection.
+    
+    The database round trips run in the threadpool so a large batch never
+    blocks other requests on the event loop.
+    """
+    inserted = await run_in_threadpool(_insert_batch, saved, db, user_id)
+    
+    for item in inserted['fresh']:
+        background_tasks.add_task(derivative_service.generate_thumbnails, item['file_path'], item['content_hash'])
+    
+    job_id = None
+    queued = inserted['queued']
+    if detection_queue and queued:
+        # Backpressure: hold the request until the workers catch up
+        await detection_queue.wait_for_capacity(len(queued))
+        job_id = detection_queue.submit(user_id, queued)
+    
+    return {'job_id': job_id, 'photos': inserted['photos']}
+
+def _bulk_batch_size() -> int:
+    if detection_queue:
+        return min(BULK_BATCH_SIZE, detection_queue.max_pending)
+    return BULK_BATCH_SIZE
+
+@router.post("/upload/bulk")
+async def upload_photos_bulk(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Upload many photos at once and queue batched face detection"""
+    result = {'photos': [], 'job_ids': [], 'skipped': []}
+    batch = []
+    
+    try:
+        for file in files:
+            if not file.content_type or not file.content_type.startswith('image/'):
+                result['skipped'].append(file.filename)
+                continue
+            
+            try:
+                batch.append(await run_in_threadpool(save_stream, file.file, file.filename, UPLOAD_DIR))
+            except ValueError as e:
+                print(f"Bulk upload skipped {file.filename}: {e}")
+                result['skipped'].append(file.filename)
+                continue
+            
+            if len(batch) >= _bulk_batch_size():
+                ingested = await _ingest_batch(batch, db, current_user.id, background_tasks)
+                result['photos'].extend(ingested['photos'])
+                result['job_ids'].append(ingested['job_id'])
+                batch = []
+        
+        if batch:
+            ingested = await _ingest_batch(batch, db, current_user.id, background_tasks)
+            result['photos'].extend(ingested['photos'])
+            result['job_ids'].append(ingested['job_id'])
+        
+        result['job_ids'] = [job_id for job_id in result['job_ids'] if job_id]
+        return result
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        print(f"Bulk upload error: {e}")
+        raise HTTPException(500, f"Bulk upload failed after {len(result['photos'])} photos: {str(e)}")
+
+@router.post("/upload/archive")
+async def upload_archive(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Import every photo from a zip or tar archive"""
+    result = {'photos': [], 'job_ids': []}
+    images = iter_archive_images(file.file, UPLOAD_DIR)
+    
+    try:
+        while True:
+            batch = await run_in_threadpool(take, images, _bulk_batch_size())
+            if not batch:
+                break
+            
+            ingested = await _ingest_batch(batch, db, current_user.id, background_tasks)
+            result['photos'].extend(ingested['photos'])
+            if ingested['job_id']:
+                result['job_ids'].append(ingested['job_id'])
+        
+        return result
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(400, f"Invalid archive: {str(e)}")
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        print(f"Archive upload error: {e}")
+        raise HTTPException(500, f"Archive upload failed after {len(result['photos'])} photos: {str(e)}")
+    finally:
+        images.close()
+
+@router.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: str,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Get progress of a background job"""
+    job = job_registry.get(job_id)
+    if not job or job['user_id'] != current_user.id:
+        raise HTTPException(404, "Job not found")
+    
+    return job
+
+def _encode_cursor(photo: Photo) -> str:
+    raw = f"{photo.created_at.isoformat()}|{photo.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, photo_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(photo_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
 @router.get("/photos")
-def get_photos(
+async def get_photos(
     person_id: Optional[int] = None,
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 50,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get user's photos with optional person filter"""
+    """Get user's photos with optional person filter.
+    
+    Pages are keyset-paginated on (created_at, id); pass the returned
+    next_cursor to fetch the following page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = _decode_cursor(cursor) if cursor else None
+    
     try:
-        query = db.query(Photo).filter(Photo.user_id == current_user.id)
+        query = select(Photo).where(Photo.user_id == current_user.id)
         
         if person_id:
-            query = query.join(Face).filter(Face.person_id == person_id)
+            # EXISTS instead of a join so photos with several matching faces appear once
+            query = query.where(Photo.faces.any(Face.person_id == person_id))
+            # Maintained on every write, so person galleries skip the COUNT
+            counts = await fetch_all(db, select(Person.photo_count).where(
+                Person.id == person_id,
+                Person.user_id == current_user.id
+            ), scalars=True)
+            total = counts[0] if counts else 0
+        else:
+            [total] = await fetch_all(db, select(func.count()).select_from(query.subquery()), scalars=True)
+        
+        if after:
+            created_at, last_id = after
+            query = query.where(or_(
+                Photo.created_at < created_at,
+                and_(Photo.created_at == created_at, Photo.id < last_id)
+            ))
         
-        total = query.count()
-        photos = query.order_by(Photo.created_at.desc()).offset(skip).limit(limit).all()
+        # Faces and their persons come in two extra queries for the whole page
+        photos = await fetch_all(db, query.options(
+            selectinload(Photo.faces).options(
+                defer(Face.embedding),
+                joinedload(Face.person)
+            )
+        ).order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit), scalars=True)
         
         result = []
         for photo in photos:
@@ -157,14 +434,12 @@ def get_photos(
                     'is_verified': face.is_verified,
                     'person': None
                 }
-                if face.person_id:
-                    person = db.query(Person).filter(Person.id == face.person_id).first()
-                    if person:
-                        face_dict['person'] = {
-                            'id': person.id,
-                            'name': person.name,
-                            'created_at': person.created_at
-                        }
+                if face.person:
+                    face_dict['person'] = {
+                        'id': face.person.id,
+                        'name': face.person.name,
+                        'created_at': face.person.created_at
+                    }
                 faces_list.append(face_dict)
             
             result.append({
@@ -175,95 +450,354 @@ def get_photos(
                 'width': photo.width,
                 'height': photo.height,
                 'faces_count': photo.faces_count,
+                'faces_status': photo.faces_status,
+                'content_hash': photo.content_hash,
                 'faces': faces_list,
                 'created_at': photo.created_at
             })
         
-        return {'photos': result, 'total': total}
+        next_cursor = _encode_cursor(photos[-1]) if len(photos) == limit else None
+        return {'photos': result, 'total': total, 'next_cursor': next_cursor}
     except Exception as e:
         print(f"Get photos error: {str(e)}")
         raise HTTPException(500, f"Failed to get photos: {str(e)}")
 
-@router.post("/faces/{face_id}/assign")
-def assign_face_to_person(
+def _cached_file_response(request: Request, path: str, fmt: str) -> Response:
+    etag = derivative_service.etag(path)
+    headers = {'ETag': etag, 'Cache-Control': DERIVATIVE_CACHE_CONTROL}
+    
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(path, media_type=derivative_service.media_type(fmt), headers=headers)
+
+@router.get("/thumbnails/{content_hash}")
+def get_thumbnail(
+    content_hash: str,
+    request: Request,
+    width: int = 512,
+    format: str = 'webp',
+    db: Session = Depends(get_db)
+):
+    """Serve a resized photo.
+    
+    Like /uploads this is unauthenticated so it works in <img> tags; the
+    sha256 content hash in the URL is what grants access.
+    """
+    if format not in DERIVATIVE_FORMATS:
+        raise HTTPException(400, f"Format must be one of {', '.join(DERIVATIVE_FORMATS)}")
+    
+    photo = db.query(Photo).filter(Photo.content_hash == content_hash).first()
+    if not photo or not os.path.exists(photo.file_path):
+        raise HTTPException(404, "Photo not found")
+    
+    path = derivative_service.get_thumbnail(photo.file_path, content_hash, derivative_service.snap_width(width), format)
+    return _cached_file_response(request, path, format)
+
+@router.get("/thumbnails/{content_hash}/faces/{face_id}")
+def get_face_crop(
+    content_hash: str,
     face_id: int,
-    request: FaceAssignRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    size: int = 160,
+    format: str = 'webp',
+    db: Session = Depends(get_db)
 ):
-    """Assign face to existing person or create new person"""
-    if not request.new_person_name and not request.person_id:
-        raise HTTPException(400, "Either new_person_name or person_id must be provided")
+    """Serve a square crop around one detected face"""
+    if format not in DERIVATIVE_FORMATS:
+        raise HTTPException(400, f"Format must be one of {', '.join(DERIVATIVE_FORMATS)}")
     
     face = db.query(Face).join(Photo).filter(
         Face.id == face_id,
-        Photo.user_id == current_user.id
+        Photo.content_hash == content_hash
     ).first()
-    
-    if not face:
+    if not face or not os.path.exists(face.photo.file_path):
         raise HTTPException(404, "Face not found")
     
-    embedding = np.array(json.loads(face.embedding_vector))
+    bbox = (face.bbox_x, face.bbox_y, face.bbox_width, face.bbox_height)
+    path = derivative_service.get_face_crop(face.photo.file_path, content_hash, bbox, derivative_service.snap_crop_size(size), format)
+    return _cached_file_response(request, path, format)
+
+def _assign_faces(faces: List[Face], request: FaceAssignRequest, db: Session, user_id: int) -> Person:
+    """Label faces with one person in one commit, then update the index once.
+    
+    The index only changes after the commit, so a failed transaction never
+    leaves orphan vectors behind.
+    """
+    embeddings = np.vstack([decode_embedding(face.embedding) for face in faces])
+    created = bool(request.new_person_name)
     
-    if request.new_person_name:
+    if created:
         if not face_service:
             raise HTTPException(503, "Face recognition service not available")
         
-        embedding_id = face_service.add_person(request.new_person_name, embedding, current_user.id)
-        
+        embedding_id = str(uuid.uuid4())
         person = Person(
-            user_id=current_user.id,
+            user_id=user_id,
             name=request.new_person_name,
             face_embedding_id=embedding_id
         )
         db.add(person)
         db.flush()
-        
-        face_service.update_person_mapping(embedding_id, person.id)
-        face.person_id = person.id
-        
-    elif request.person_id:
+    else:
         person = db.query(Person).filter(
             Person.id == request.person_id,
-            Person.user_id == current_user.id
+            Person.user_id == user_id
         ).first()
         
         if not person:
             raise HTTPException(404, "Person not found")
+    
+    # Faces may move away from other persons, whose stats change too
+    previous_person_ids = {face.person_id for face in faces}
+    lock_persons(db, previous_person_ids | {person.id})
+    db.query(Face).filter(Face.id.in_([face.id for face in faces])).update({
+        'person_id': person.id,
+        'is_verified': True,
+        'cluster_id': None
+    }, synchronize_session=False)
+    refresh_person_stats(db, previous_person_ids | {person.id})
+    db.commit()
+    
+    if face_service:
+        try:
+            if created:
+                face_service.add_person(person.id, person.name, embeddings, user_id, person.face_embedding_id)
+            else:
+                face_service.update_person_embeddings(person.id, embeddings, user_id)
+        except Exception as e:
+            # The database is the source of truth; POST /gallery/index/rebuild reconciles
+            print(f"Face index update failed for person {person.id}: {e}")
+    return person
+
+def _schedule_rematch(background_tasks: BackgroundTasks, user_id: int, person_ids: List[int]) -> Optional[str]:
+    """Look for more faces of freshly labelled persons among the unassigned ones"""
+    if not face_service:
+        return None
+    
+    job_id, is_new = schedule_rematch(user_id, person_ids)
+    if is_new:
+        background_tasks.add_task(run_rematch_job, job_id, user_id, face_service)
+    return job_id
+
+@router.post("/faces/{face_id}/assign")
+def assign_face_to_person(
+    face_id: int,
+    request: FaceAssignRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Assign face to existing person or create new person"""
+    face = db.query(Face).join(Photo).filter(
+        Face.id == face_id,
+        Photo.user_id == current_user.id
+    ).first()
+    
+    if not face:
+        raise HTTPException(404, "Face not found")
+    
+    person = _assign_faces([face], request, db, current_user.id)
+    
+    rematch_job_id = _schedule_rematch(background_tasks, current_user.id, [person.id])
+    return {"message": "Face assigned successfully", "rematch_job_id": rematch_job_id}
+
+@router.post("/faces/assign")
+def assign_faces_to_person(
+    request: FaceBulkAssignRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Assign many faces to an existing or new person at once"""
+    face_ids = set(request.face_ids)
+    if not face_ids:
+        raise HTTPException(400, "face_ids must not be empty")
+    if len(face_ids) > MAX_BULK_ASSIGN:
+        raise HTTPException(400, f"At most {MAX_BULK_ASSIGN} faces can be assigned per request")
+    
+    faces = db.query(Face).join(Photo).filter(
+        Face.id.in_(face_ids),
+        Photo.user_id == current_user.id
+    ).all()
+    
+    if len(faces) != len(face_ids):
+        raise HTTPException(404, "Face not found")
+    
+    person = _assign_faces(faces, request, db, current_user.id)
+    
+    rematch_job_id = _schedule_rematch(background_tasks, current_user.id, [person.id])
+    return {"message": "Faces assigned successfully", "person_id": person.id, "assigned": len(faces), "rematch_job_id": rematch_job_id}
+
+@router.post("/clusters/{cluster_id}/assign")
+def assign_cluster_to_person(
+    cluster_id: int,
+    request: FaceAssignRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Name a suggested cluster, labelling all of its unassigned faces"""
+    cluster = db.query(FaceCluster).filter(
+        FaceCluster.id == cluster_id,
+        FaceCluster.user_id == current_user.id
+    ).first()
+    
+    if not cluster:
+        raise HTTPException(404, "Cluster not found")
+    
+    faces = db.query(Face).filter(
+        Face.cluster_id == cluster_id,
+        Face.person_id.is_(None)
+    ).all()
+    
+    if not faces:
+        raise HTTPException(404, "Cluster has no unassigned faces")
+    
+    # Every member is about to belong to a person, so the suggestion is spent
+    db.query(Face).filter(Face.cluster_id == cluster_id).update({'cluster_id': None}, synchronize_session=False)
+    db.delete(cluster)
+    person = _assign_faces(faces, request, db, current_user.id)
+    
+    rematch_job_id = _schedule_rematch(background_tasks, current_user.id, [person.id])
+    return {"message": "Cluster assigned successfully", "person_id": person.id, "assigned": len(faces), "rematch_job_id": rematch_job_id}
+
+@router.post("/clusters/rebuild")
+def rebuild_clusters(
+    background_tasks: BackgroundTasks,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Regroup all unassigned faces into suggested persons in the background"""
+    job_id = job_registry.create('face_clustering', current_user.id)
+    background_tasks.add_task(run_clustering_job, job_id, current_user.id)
+    return {'job_id': job_id}
+
+@router.get("/clusters")
+async def get_clusters(
+    limit: int = 50,
+    db = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Get suggested clusters of unassigned faces, largest first"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    try:
+        face_count = func.count(Face.id)
+        rows = await fetch_all(db, select(Face.cluster_id, face_count, func.min(Face.id)).join(Photo).where(
+            Photo.user_id == current_user.id,
+            Face.cluster_id.isnot(None),
+            Face.person_id.is_(None)
+        ).group_by(Face.cluster_id).order_by(face_count.desc()).limit(limit))
         
-        if face_service:
-            face_service.update_person_embedding(person.id, embedding)
+        cover_ids = [cover_id for _, _, cover_id in rows]
+        covers = dict(await fetch_all(db, select(Face.id, Photo.content_hash).join(Photo).where(Face.id.in_(cover_ids))))
         
-        face.person_id = person.id
+        return [{
+            'id': cluster_id,
+            'size': size,
+            'cover_face': {'id': cover_id, 'content_hash': covers.get(cover_id)}
+        } for cluster_id, size, cover_id in rows]
+    except Exception as e:
+        print(f"Get clusters error: {str(e)}")
+        raise HTTPException(500, f"Failed to get clusters: {str(e)}")
+
+@router.get("/clusters/{cluster_id}/faces")
+def get_cluster_faces(
+    cluster_id: int,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Get the unassigned faces of one suggested cluster"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
     
-    face.is_verified = True
-    db.commit()
+    cluster = db.query(FaceCluster).filter(
+        FaceCluster.id == cluster_id,
+        FaceCluster.user_id == current_user.id
+    ).first()
+    
+    if not cluster:
+        raise HTTPException(404, "Cluster not found")
     
-    return {"message": "Face assigned successfully"}
+    rows = db.query(Face, Photo.content_hash).join(Photo).options(defer(Face.embedding)).filter(
+        Face.cluster_id == cluster_id,
+        Face.person_id.is_(None)
+    ).order_by(Face.id).limit(limit).all()
+    
+    return [{
+        'id': face.id,
+        'photo_id': face.photo_id,
+        'content_hash': content_hash,
+        'bbox_x': face.bbox_x,
+        'bbox_y': face.bbox_y,
+        'bbox_width': face.bbox_width,
+        'bbox_height': face.bbox_height,
+        'confidence': face.confidence
+    } for face, content_hash in rows]
 
 @router.get("/persons")
-def get_persons(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_persons(
+    db = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Get all persons for current user"""
     try:
-        persons = db.query(Person).filter(Person.user_id == current_user.id).all()
+        # The cover's photo comes from the same query; counts are stored on the person
+        rows = await fetch_all(db, select(Person, Photo.content_hash).outerjoin(
+            Face, Face.id == Person.cover_face_id
+        ).outerjoin(Photo, Photo.id == Face.photo_id).where(Person.user_id == current_user.id))
         return [{
             'id': p.id,
             'name': p.name,
+            'photo_count': p.photo_count,
+            'cover_face': {'id': p.cover_face_id, 'content_hash': content_hash} if p.cover_face_id else None,
             'created_at': p.created_at
-        } for p in persons]
+        } for p, content_hash in rows]
     except Exception as e:
         print(f"Get persons error: {str(e)}")
         raise HTTPException(500, f"Failed to get persons: {str(e)}")
 
+@router.post("/persons/{person_id}/rematch")
+def rematch_person(
+    person_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Scan unassigned faces for more photos of a person"""
+    if not face_service:
+        raise HTTPException(503, "Face recognition service not available")
+    
+    person = db.query(Person).filter(
+        Person.id == person_id,
+        Person.user_id == current_user.id
+    ).first()
+    
+    if not person:
+        raise HTTPException(404, "Person not found")
+    
+    return {'job_id': _schedule_rematch(background_tasks, current_user.id, [person.id])}
+
+@router.post("/index/rebuild")
+def rebuild_face_index(
+    background_tasks: BackgroundTasks,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Rebuild the user's face index from the database in the background"""
+    if not face_service:
+        raise HTTPException(503, "Face recognition service not available")
+    
+    job_id = job_registry.create('index_rebuild', current_user.id)
+    background_tasks.add_task(run_rebuild_job, job_id, current_user.id, face_service.index_manager)
+    return {'job_id': job_id}
+
 @router.put("/persons/{person_id}")
 def update_person(
     person_id: int,
     request: PersonUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Update person name"""
     person = db.query(Person).filter(
@@ -277,38 +811,61 @@ def update_person(
     person.name = request.name
     db.commit()
     
+    if face_service:
+        face_service.update_person_mapping(person_id, current_user.id, name=request.name)
+    
     return {"message": "Person updated successfully"}
 
 @router.delete("/photos/{photo_id}")
 def delete_photo(
     photo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Delete photo and its file"""
+    # Photo before persons, the same lock order as saving detection results
     photo = db.query(Photo).filter(
         Photo.id == photo_id,
         Photo.user_id == current_user.id
-    ).first()
+    ).with_for_update().first()
     
     if not photo:
         raise HTTPException(404, "Photo not found")
     
-    # Delete file
-    if os.path.exists(photo.file_path):
-        os.remove(photo.file_path)
+    # Blobs are shared by every photo with the same content, derivatives by every photo with the same hash
+    shared = db.query(Photo.id).filter(
+        Photo.content_hash == photo.content_hash,
+        Photo.file_path == photo.file_path,
+        Photo.id != photo.id
+    ).first() if photo.content_hash else None
+    hash_in_use = db.query(Photo.id).filter(
+        Photo.content_hash == photo.content_hash,
+        Photo.id != photo.id
+    ).first() if photo.content_hash else None
     
     # Delete from database (faces cascade delete)
+    file_path = photo.file_path
+    content_hash = photo.content_hash
+    person_ids = {face.person_id for face in photo.faces}
+    lock_persons(db, person_ids)
     db.delete(photo)
+    db.flush()
+    refresh_person_stats(db, person_ids)
     db.commit()
     
+    # Delete the file and its derivatives once nothing references them
+    if not shared and os.path.exists(file_path):
+        os.remove(file_path)
+    if content_hash and not hash_in_use:
+        derivative_service.delete_derivatives(content_hash)
+    
     return {"message": "Photo deleted successfully"}
 
 @router.delete("/persons/{person_id}")
 def delete_person(
     person_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Delete person and unassign all faces"""
     person = db.query(Person).filter(
@@ -325,11 +882,12 @@ def delete_person(
         'is_verified': False
     })
     
-    # Remove from face service
-    face_service.delete_person(person_id)
-    
     # Delete person
     db.delete(person)
     db.commit()
     
+    # Remove from face service once the delete is durable
+    if face_service:
+        face_service.delete_person(person_id, current_user.id)
+    
     return {"message": "Person deleted successfully"}
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import List, Optional
 from datetime import datetime
 
@@ -7,6 +7,9 @@ class PhotoUploadResponse(BaseModel):
     filename: str
     faces_count: int
     faces: List[dict]
+    faces_status: str
+    job_id: Optional[str] = None
+    duplicate: bool = False
     
 class FaceCreate(BaseModel):
     photo_id: int
@@ -15,7 +18,7 @@ class FaceCreate(BaseModel):
     bbox_width: float
     bbox_height: float
     confidence: float
-    embedding_vector: str
+    embedding: bytes
     
 class PersonCreate(BaseModel):
     name: str
@@ -46,13 +49,25 @@ class PhotoResponse(BaseModel):
     width: Optional[int]
     height: Optional[int]
     faces_count: int
+    faces_status: str
+    content_hash: Optional[str]
     faces: List[FaceResponse]
     created_at: datetime
     
 class GalleryResponse(BaseModel):
     photos: List[PhotoResponse]
     total: int
+    next_cursor: Optional[str] = None
     
 class FaceAssignRequest(BaseModel):
     person_id: Optional[int] = None
-    new_person_name: Optional[str] = None
\ No newline at end of file
+    new_person_name: Optional[str] = None
+    
+    @model_validator(mode='after')
+    def check_one_target(self):
+        if bool(self.person_id) == bool(self.new_person_name):
+            raise ValueError("Exactly one of person_id or new_person_name must be provided")
+        return self
+    
+class FaceBulkAssignRequest(FaceAssignRequest):
+    face_ids: List[int]
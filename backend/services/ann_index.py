@@ -0,0 +1,76 @@
+import faiss
+import numpy as np
+import os
+
+ANN_BACKENDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "flat")
+FACE_INDEX_TRAIN_THRESHOLD = int(os.getenv("FACE_INDEX_TRAIN_THRESHOLD", "20000"))
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "16"))
+FACE_INDEX_EF_SEARCH = int(os.getenv("FACE_INDEX_EF_SEARCH", "64"))
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_SUBQUANTIZERS = 64
+# FAISS warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+if FACE_INDEX_BACKEND not in ANN_BACKENDS:
+    raise ValueError(f"FACE_INDEX_BACKEND must be one of {ANN_BACKENDS}, got {FACE_INDEX_BACKEND!r}")
+
+# Applied before every approximate search; set through FACE_INDEX_NPROBE and FACE_INDEX_EF_SEARCH
+search_params = {'nprobe': FACE_INDEX_NPROBE, 'ef_search': FACE_INDEX_EF_SEARCH}
+
+def build_ann_index(backend: str, vectors: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    """Train an approximate index for `backend` and add the vectors under their ids"""
+    n, dim = vectors.shape
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+
+    if backend == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif backend in ("ivf_flat", "ivf_pq"):
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+        quantizer = faiss.IndexFlatL2(dim)
+        if backend == "ivf_pq":
+            # Fewer bits per code when there isn't enough data to train 256 centroids
+            nbits = int(min(8, max(4, np.log2(max(n // MIN_POINTS_PER_CENTROID, 16)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_SUBQUANTIZERS, nbits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(vectors)
+        # Hashtable direct map keeps remove_ids proportional to the ids removed
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        raise ValueError(f"Unknown ANN backend: {backend}")
+
+    index.add_with_ids(vectors, ids)
+    return index
+
+def set_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None):
+    """Apply runtime search parameters to an approximate index"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+    if isinstance(inner, faiss.IndexIVF) and nprobe is not None:
+        inner.nprobe = min(nprobe, inner.nlist)
+    if isinstance(inner, faiss.IndexHNSW) and ef_search is not None:
+        inner.hnsw.efSearch = ef_search
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> bool:
+    """Remove ids in place where the backend supports it; returns False for HNSW"""
+    if not isinstance(index, faiss.IndexIVF):
+        return False
+
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    index.remove_ids(faiss.IDSelectorArray(len(ids), faiss.swig_ptr(ids)))
+    return True
+
+def ann_memory_bytes(backend: str, ntotal: int, dim: int) -> int:
+    """Rough resident size of an approximate index"""
+    if backend == "ivf_pq":
+        return ntotal * (PQ_SUBQUANTIZERS + 8)
+    if backend == "hnsw":
+        return ntotal * (dim * 4 + HNSW_M * 2 * 4 + 8)
+    return ntotal * (dim * 4 + 8)
@@ -0,0 +1,74 @@
+"""Fill in photos.content_hash for photos uploaded before uploads were hashed.
+
+Migration 8a4e6b2c9d10 only adds the column; until this runs, those photos
+get no duplicate detection, no detection-cache hits and no thumbnails or
+face crops. Files stay where they are. Safe to re-run. From the backend folder:
+    python -m services.content_hash_backfill
+"""
+import argparse
+import os
+from typing import Dict
+
+from connection import SessionLocal
+from models import Photo
+from utils.uploads import hash_file
+
+BACKFILL_CHUNK_SIZE = 500
+
+def backfill_content_hashes(chunk_size: int = BACKFILL_CHUNK_SIZE) -> Dict[str, int]:
+    """Hash the file of every photo without a content hash, one committed chunk at a time.
+
+    Like migration 4d7a9c3e1b58, only the oldest of a user's identical photos
+    gets the hash, so the (user_id, content_hash) unique index holds.
+    """
+    stats = {'hashed': 0, 'duplicates': 0, 'missing': 0}
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            photos = db.query(Photo).filter(
+                Photo.content_hash.is_(None),
+                Photo.id > last_id
+            ).order_by(Photo.id).limit(chunk_size).all()
+            if not photos:
+                break
+            last_id = photos[-1].id
+
+            hashes = {}
+            for photo in photos:
+                if os.path.exists(photo.file_path):
+                    hashes[photo.id] = hash_file(photo.file_path)
+                else:
+                    stats['missing'] += 1
+
+            taken = set(db.query(Photo.user_id, Photo.content_hash).filter(
+                Photo.user_id.in_({photo.user_id for photo in photos}),
+                Photo.content_hash.in_(set(hashes.values()))
+            ).all()) if hashes else set()
+
+            for photo in photos:
+                content_hash = hashes.get(photo.id)
+                if content_hash is None:
+                    continue
+                if (photo.user_id, content_hash) in taken:
+                    stats['duplicates'] += 1
+                    continue
+                photo.content_hash = content_hash
+                taken.add((photo.user_id, content_hash))
+                stats['hashed'] += 1
+            db.commit()
+        return stats
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    stats = backfill_content_hashes(args.chunk_size)
+    print(f"Hashed {stats['hashed']} photos; {stats['duplicates']} duplicates of an older photo "
+          f"and {stats['missing']} with a missing file were left without a hash")
+
+if __name__ == "__main__":
+    main()
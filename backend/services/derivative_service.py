@@ -0,0 +1,175 @@
+import hashlib
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+
+DERIVATIVE_DIR = "./derivatives"
+THUMBNAIL_WIDTHS = (256, 512, 1024)
+FACE_CROP_SIZES = (96, 160, 320)
+DEFAULT_FACE_CROP_SIZE = 160
+# Face crops include some context around the detected box
+FACE_CROP_MARGIN = 0.25
+# Bump when encoder settings change so cached files are regenerated under new names
+DERIVATIVE_VERSION = 1
+
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'media_type': 'image/webp', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'format': 'JPEG', 'media_type': 'image/jpeg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+class DerivativeService:
+    """Generates thumbnails and face crops into a content-addressed disk cache"""
+
+    def __init__(self, cache_dir: str = DERIVATIVE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def snap_width(width: int) -> int:
+        """Smallest configured width that covers the requested one"""
+        for candidate in THUMBNAIL_WIDTHS:
+            if candidate >= width:
+                return candidate
+        return THUMBNAIL_WIDTHS[-1]
+
+    @staticmethod
+    def snap_crop_size(size: int) -> int:
+        for candidate in FACE_CROP_SIZES:
+            if candidate >= size:
+                return candidate
+        return FACE_CROP_SIZES[-1]
+
+    def _path(self, content_hash: str, name: str) -> str:
+        # Two-level fan-out keeps directories small on large libraries
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}_{name}_v{DERIVATIVE_VERSION}")
+
+    def thumbnail_path(self, content_hash: str, width: int, fmt: str) -> str:
+        return f"{self._path(content_hash, f'w{width}')}.{fmt}"
+
+    def face_crop_path(self, content_hash: str, bbox: Tuple[float, float, float, float], size: int, fmt: str) -> str:
+        bbox_key = hashlib.sha1(",".join(f"{v:.1f}" for v in bbox).encode()).hexdigest()[:12]
+        return f"{self._path(content_hash, f'face{bbox_key}_s{size}')}.{fmt}"
+
+    @staticmethod
+    def media_type(fmt: str) -> str:
+        return DERIVATIVE_FORMATS[fmt]['media_type']
+
+    @staticmethod
+    def etag(path: str) -> str:
+        # File names are derived from content, so the name itself is a strong validator
+        return f'"{os.path.splitext(os.path.basename(path))[0]}"'
+
+    def _open(self, source_path: str, max_width: Optional[int] = None) -> Image.Image:
+        """Decode an upright copy of the source, reduced where the format allows it"""
+        with Image.open(source_path) as src:
+            if max_width:
+                # JPEG can decode straight to a smaller scale; asking for a square keeps
+                # both sides >= max_width whatever the EXIF rotation turns out to be
+                src.draft('RGB', (max_width, max_width))
+            img = ImageOps.exif_transpose(src)
+            img.load()
+        return img.convert('RGB') if img.mode not in ('RGB', 'L') else img
+
+    def _save(self, img: Image.Image, path: str, fmt: str):
+        """Write atomically so concurrent readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        spec = DERIVATIVE_FORMATS[fmt]
+        try:
+            img.save(tmp_path, spec['format'], **spec['options'])
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def generate_thumbnails(self, source_path: str, content_hash: str) -> Dict[str, str]:
+        """Decode the source once and write every thumbnail width and format"""
+        try:
+            with self._open(source_path, max_width=THUMBNAIL_WIDTHS[-1]) as img:
+                return self.generate_thumbnails_from_image(img, content_hash)
+        except Exception as e:
+            print(f"Thumbnail generation failed for {source_path}: {e}")
+        return {}
+
+    def generate_thumbnails_from_image(self, img: Image.Image, content_hash: str) -> Dict[str, str]:
+        """Write every thumbnail width and format from an already decoded, upright image"""
+        generated = {}
+        try:
+            # Largest first so each step downsizes the previous result
+            current = img
+            for width in sorted(THUMBNAIL_WIDTHS, reverse=True):
+                if current.width > width:
+                    current = current.resize((width, max(1, current.height * width // current.width)), Image.LANCZOS)
+                for fmt in DERIVATIVE_FORMATS:
+                    path = self.thumbnail_path(content_hash, width, fmt)
+                    if not os.path.exists(path):
+                        self._save(current, path, fmt)
+                    generated[f"{width}.{fmt}"] = path
+        except Exception as e:
+            print(f"Thumbnail generation failed for {content_hash}: {e}")
+        return generated
+
+    def get_thumbnail(self, source_path: str, content_hash: str, width: int, fmt: str) -> str:
+        """Return the cached thumbnail, generating it on a miss"""
+        path = self.thumbnail_path(content_hash, width, fmt)
+        if not os.path.exists(path):
+            with self._open(source_path, max_width=width) as img:
+                if img.width > width:
+                    img = img.resize((width, max(1, img.height * width // img.width)), Image.LANCZOS)
+                self._save(img, path, fmt)
+        return path
+
+    def generate_face_crops(self, source_path: str, content_hash: str, bboxes: List[Tuple[float, float, float, float]]):
+        """Decode the source once and write the default-size crop for every face"""
+        try:
+            with self._open(source_path) as img:
+                for bbox in bboxes:
+                    for fmt in DERIVATIVE_FORMATS:
+                        path = self.face_crop_path(content_hash, bbox, DEFAULT_FACE_CROP_SIZE, fmt)
+                        if not os.path.exists(path):
+                            self._save(self._crop_face(img, bbox, DEFAULT_FACE_CROP_SIZE), path, fmt)
+        except Exception as e:
+            print(f"Face crop generation failed for {source_path}: {e}")
+
+    def _crop_face(self, img: Image.Image, bbox: Tuple[float, float, float, float], size: int) -> Image.Image:
+        x, y, w, h = bbox
+        side = max(w, h) * (1 + 2 * FACE_CROP_MARGIN)
+        cx, cy = x + w / 2, y + h / 2
+        box = (
+            int(max(0, cx - side / 2)),
+            int(max(0, cy - side / 2)),
+            int(min(img.width, cx + side / 2)),
+            int(min(img.height, cy + side / 2))
+        )
+        crop = img.crop(box)
+        crop.thumbnail((size, size), Image.LANCZOS)
+        return crop
+
+    def get_face_crop(self, source_path: str, content_hash: str, bbox: Tuple[float, float, float, float], size: int, fmt: str) -> str:
+        """Return a square crop around a detected face, generating it on a miss"""
+        path = self.face_crop_path(content_hash, bbox, size, fmt)
+        if os.path.exists(path):
+            return path
+
+        with self._open(source_path) as img:
+            self._save(self._crop_face(img, bbox, size), path, fmt)
+        return path
+
+    def delete_derivatives(self, content_hash: str) -> int:
+        """Remove every cached thumbnail and face crop of a file; returns how many went"""
+        directory = os.path.dirname(self._path(content_hash, ""))
+        if not os.path.isdir(directory):
+            return 0
+
+        removed = 0
+        for entry in os.scandir(directory):
+            # Includes files of older DERIVATIVE_VERSIONs and any leftover temp files
+            if entry.name.startswith(f"{content_hash}_"):
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+derivative_service = DerivativeService()
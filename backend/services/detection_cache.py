@@ -0,0 +1,50 @@
+import json
+import os
+import numpy as np
+from typing import Dict, Iterable, List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import DetectionCache
+from utils.embeddings import EMBEDDING_DIM
+
+# Bump when the detector, recognizer or det_size changes so stale results are not reused
+FACE_MODEL_VERSION = os.getenv("FACE_MODEL_VERSION", "buffalo_l-640")
+
+def load_cached_detections(db: Session, content_hashes: Iterable[str]) -> Dict[str, List[dict]]:
+    """Cached face data by content hash, shaped like detect_faces_in_photos output"""
+    content_hashes = set(content_hashes)
+    if not content_hashes:
+        return {}
+    
+    rows = db.query(DetectionCache).filter(
+        DetectionCache.content_hash.in_(content_hashes),
+        DetectionCache.model_version == FACE_MODEL_VERSION
+    ).all()
+    
+    cached = {}
+    for row in rows:
+        detections = json.loads(row.detections)
+        # An explicit width: -1 can't be inferred for photos without faces
+        embeddings = np.frombuffer(row.embeddings, dtype=np.float32).reshape(row.faces_count, EMBEDDING_DIM)
+        cached[row.content_hash] = [{
+            'bbox': detection['bbox'],
+            'confidence': detection['confidence'],
+            'embedding': embedding
+        } for detection, embedding in zip(detections, embeddings)]
+    return cached
+
+def store_detections(db: Session, content_hash: str, faces_data: List[dict]):
+    """Remember the detection result for a file; losing an insert race is harmless"""
+    row = DetectionCache(
+        content_hash=content_hash,
+        model_version=FACE_MODEL_VERSION,
+        faces_count=len(faces_data),
+        detections=json.dumps([{'bbox': f['bbox'], 'confidence': f['confidence']} for f in faces_data]),
+        embeddings=b''.join(np.asarray(f['embedding'], dtype=np.float32).tobytes() for f in faces_data)
+    )
+    try:
+        with db.begin_nested():
+            db.add(row)
+    except IntegrityError:
+        pass
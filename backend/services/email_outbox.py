@@ -0,0 +1,165 @@
+import os
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from connection import SessionLocal
+from models import EmailOutbox
+from utils.email import SMTPConnection, build_message, otp_email
+
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "5"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = 3600
+# A claimed batch goes back to the queue if its sender dies before this
+EMAIL_LEASE_SECONDS = 300
+
+def queue_email(db: Session, to_address: str, subject: str, body: str) -> EmailOutbox:
+    """Add an email to the outbox; it is sent once the caller commits"""
+    email = EmailOutbox(
+        to_address=to_address,
+        subject=subject,
+        body=body,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(email)
+    return email
+
+def queue_otp_email(db: Session, to_address: str, otp_code: str) -> EmailOutbox:
+    subject, body = otp_email(otp_code)
+    return queue_email(db, to_address, subject, body)
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS))
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx replies about the message or recipient won't succeed on retry; 4xx, auth and network errors might"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    return (
+        isinstance(error, smtplib.SMTPResponseException)
+        and not isinstance(error, smtplib.SMTPAuthenticationError)
+        and 500 <= error.smtp_code < 600
+    )
+
+class EmailSender:
+    """Background thread that drains the outbox in batches over one kept-alive SMTP connection"""
+
+    def __init__(self, connection: Optional[SMTPConnection] = None, batch_size: int = EMAIL_BATCH_SIZE):
+        self.connection = connection or SMTPConnection()
+        self.batch_size = batch_size
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name="email-sender", daemon=True)
+            self.thread.start()
+
+    def notify(self):
+        """Send newly queued emails now instead of at the next poll"""
+        self.wake_event.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            self.wake_event.clear()
+            try:
+                claimed = self.drain_once()
+            except Exception as e:
+                print(f"Email outbox error: {e}")
+                claimed = 0
+            # A full batch means more may be waiting
+            if claimed < self.batch_size:
+                self.wake_event.wait(EMAIL_POLL_INTERVAL)
+        self.connection.close()
+
+    def _claim(self) -> List[Tuple[int, str, str, str, int]]:
+        """Lease a batch of due emails; SKIP LOCKED keeps other API workers off the same rows"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            rows = db.query(EmailOutbox).filter(
+                EmailOutbox.status.in_(('pending', 'sending')),
+                EmailOutbox.next_attempt_at <= now
+            ).order_by(EmailOutbox.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+            batch = [(row.id, row.to_address, row.subject, row.body, row.attempts) for row in rows]
+            for row in rows:
+                row.status = 'sending'
+                row.next_attempt_at = now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+            db.commit()
+            return batch
+        finally:
+            db.close()
+
+    def drain_once(self) -> int:
+        """Send one batch and record the outcome of each email; returns how many were claimed"""
+        batch = self._claim()
+        if not batch:
+            return 0
+
+        outcomes = {}
+        for position, (email_id, to_address, subject, body, attempts) in enumerate(batch):
+            try:
+                self.connection.send(build_message(to_address, subject, body))
+                outcomes[email_id] = None
+            except Exception as e:
+                outcomes[email_id] = e
+                if not _is_permanent(e):
+                    # The server or network is the problem; the rest of the batch would fail the same way
+                    self.connection.close()
+                    break
+        self._record(batch, outcomes)
+        return len(batch)
+
+    def _record(self, batch: List[Tuple[int, str, str, str, int]], outcomes: dict):
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            rows = {row.id: row for row in db.query(EmailOutbox).filter(EmailOutbox.id.in_([item[0] for item in batch]))}
+            retry_at = now
+            for email_id, to_address, _, _, attempts in batch:
+                row = rows.get(email_id)
+                if row is None:
+                    continue
+
+                if email_id not in outcomes:
+                    # Not tried because the connection failed earlier in the batch
+                    row.status = 'pending'
+                    row.next_attempt_at = retry_at
+                    continue
+
+                error = outcomes[email_id]
+                if error is None:
+                    row.status = 'sent'
+                    row.sent_at = now
+                    row.last_error = None
+                    continue
+
+                row.attempts = attempts + 1
+                row.last_error = str(error)
+                if _is_permanent(error) or row.attempts >= EMAIL_MAX_ATTEMPTS:
+                    row.status = 'failed'
+                    print(f"Giving up on email {email_id} to {to_address} after {row.attempts} attempts: {error}")
+                else:
+                    row.status = 'pending'
+                    retry_at = now + _retry_delay(row.attempts)
+                    row.next_attempt_at = retry_at
+            db.commit()
+        finally:
+            db.close()
+
+email_sender = EmailSender()
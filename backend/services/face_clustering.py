@@ -0,0 +1,157 @@
+import os
+import faiss
+import numpy as np
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+
+from connection import SessionLocal
+from models import Face, FaceCluster, Photo
+from services.ann_index import FACE_INDEX_TRAIN_THRESHOLD, build_ann_index, set_search_params, search_params
+from services.job_registry import job_registry
+from utils.embeddings import decode_embedding
+
+# Cosine similarity needed to link two faces, or a new face to a cluster centroid
+CLUSTER_THRESHOLD = float(os.getenv("FACE_CLUSTER_THRESHOLD", "0.6"))
+CLUSTER_NEIGHBORS = int(os.getenv("FACE_CLUSTER_NEIGHBORS", "10"))
+# Smaller components stay unclustered until more faces of that person show up
+MIN_CLUSTER_SIZE = int(os.getenv("FACE_CLUSTER_MIN_SIZE", "2"))
+UPDATE_CHUNK_SIZE = 1000
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+def _knn(vectors: np.ndarray, k: int):
+    """k nearest neighbours of every vector as (cosine similarities, positions)"""
+    n, dim = vectors.shape
+    positions = np.arange(n, dtype=np.int64)
+    if n >= FACE_INDEX_TRAIN_THRESHOLD:
+        # Exact all-pairs search is quadratic; an IVF index keeps large libraries tractable
+        index = build_ann_index("ivf_flat", vectors, positions)
+        set_search_params(index, nprobe=search_params['nprobe'])
+    else:
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+
+    distances, neighbors = index.search(vectors, min(k + 1, n))
+    # Squared L2 between unit vectors is 2 - 2cos
+    return 1 - distances / 2, neighbors
+
+def connected_components(n: int, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Label every node with the smallest node index in its component"""
+    labels = np.arange(n)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, src, labels[dst])
+        np.minimum.at(labels, dst, labels[src])
+        # Pointer jumping collapses long chains in a few rounds
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+def cluster_embeddings(embeddings: np.ndarray, k: int = CLUSTER_NEIGHBORS, threshold: float = CLUSTER_THRESHOLD) -> np.ndarray:
+    """Group embeddings through a thresholded k-NN graph.
+
+    Returns one label per row; rows outside any cluster of MIN_CLUSTER_SIZE get -1.
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    similarities, neighbors = _knn(_normalize(embeddings), k)
+    src = np.repeat(np.arange(n), neighbors.shape[1])
+    dst = neighbors.ravel()
+    keep = (similarities.ravel() >= threshold) & (dst >= 0) & (dst != src)
+
+    labels = connected_components(n, src[keep], dst[keep])
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    return np.where(counts[inverse] >= MIN_CLUSTER_SIZE, labels, -1)
+
+def recluster_user(db: Session, user_id: int) -> Dict:
+    """Replace a user's clusters with a fresh clustering of all unassigned faces"""
+    rows = db.query(Face.id, Face.embedding).join(Photo).filter(
+        Photo.user_id == user_id,
+        Face.person_id.is_(None)
+    ).all()
+
+    cluster_ids = db.query(FaceCluster.id).filter(FaceCluster.user_id == user_id)
+    db.query(Face).filter(Face.cluster_id.in_(cluster_ids.scalar_subquery())).update(
+        {'cluster_id': None}, synchronize_session=False
+    )
+    db.query(FaceCluster).filter(FaceCluster.user_id == user_id).delete(synchronize_session=False)
+
+    if not rows:
+        db.commit()
+        return {'faces': 0, 'clusters': 0, 'clustered_faces': 0}
+
+    face_ids = np.array([face_id for face_id, _ in rows])
+    embeddings = _normalize(np.vstack([decode_embedding(blob) for _, blob in rows]))
+    labels = cluster_embeddings(embeddings)
+
+    members_by_label = {}
+    for position, label in enumerate(labels):
+        if label >= 0:
+            members_by_label.setdefault(label, []).append(position)
+
+    clusters = []
+    for members in members_by_label.values():
+        centroid = _normalize(embeddings[members].mean(axis=0, keepdims=True))[0]
+        clusters.append((FaceCluster(user_id=user_id, size=len(members), centroid=centroid.tobytes()), members))
+    db.add_all([cluster for cluster, _ in clusters])
+    db.flush()
+
+    mappings = [{'id': int(face_ids[position]), 'cluster_id': cluster.id} for cluster, members in clusters for position in members]
+    for start in range(0, len(mappings), UPDATE_CHUNK_SIZE):
+        db.bulk_update_mappings(Face, mappings[start:start + UPDATE_CHUNK_SIZE])
+
+    db.commit()
+    return {'faces': len(rows), 'clusters': len(clusters), 'clustered_faces': len(mappings)}
+
+def fold_into_clusters(db: Session, user_id: int, embeddings: np.ndarray) -> List[Optional[int]]:
+    """Match new unassigned faces to existing cluster centroids.
+
+    Returns the cluster id for each row (None when nothing is close enough)
+    and moves the matched centroids toward their new members. The caller sets
+    Face.cluster_id and commits.
+    """
+    clusters = db.query(FaceCluster).filter(FaceCluster.user_id == user_id).all()
+    if not clusters or len(embeddings) == 0:
+        return [None] * len(embeddings)
+
+    vectors = _normalize(embeddings)
+    centroids = np.vstack([np.frombuffer(cluster.centroid, dtype=np.float32) for cluster in clusters])
+    index = faiss.IndexFlatL2(centroids.shape[1])
+    index.add(centroids)
+    distances, positions = index.search(vectors, 1)
+    similarities = 1 - distances[:, 0] / 2
+
+    assigned = []
+    folded = {}
+    for row, (similarity, position) in enumerate(zip(similarities, positions[:, 0])):
+        if position < 0 or similarity < CLUSTER_THRESHOLD:
+            assigned.append(None)
+            continue
+        assigned.append(clusters[position].id)
+        folded.setdefault(position, []).append(row)
+
+    for position, rows in folded.items():
+        cluster = clusters[position]
+        total = centroids[position] * cluster.size + vectors[rows].sum(axis=0)
+        cluster.centroid = _normalize(total.reshape(1, -1))[0].tobytes()
+        cluster.size += len(rows)
+
+    return assigned
+
+def run_clustering_job(job_id: str, user_id: int):
+    """Background entry point for a full recluster of one user's faces"""
+    job_registry.update(job_id, status='processing')
+    db = SessionLocal()
+    try:
+        result = recluster_user(db, user_id)
+        job_registry.update(job_id, status='completed', **result)
+    except Exception as e:
+        db.rollback()
+        print(f"Clustering job {job_id} failed: {e}")
+        job_registry.update(job_id, status='failed', error=str(e))
+    finally:
+        db.close()
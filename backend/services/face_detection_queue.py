@@ -0,0 +1,323 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple, Union
+from starlette.concurrency import run_in_threadpool
+
+from connection import SessionLocal
+from models import Photo, Face
+from services.job_registry import job_registry
+from services.derivative_service import derivative_service
+from services.detection_cache import load_cached_detections, store_detections
+from services.face_clustering import fold_into_clusters
+from services.person_stats import lock_persons, refresh_person_stats
+from utils.embeddings import encode_embedding
+
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "2"))
+DETECTION_MAX_PENDING = int(os.getenv("DETECTION_MAX_PENDING", "64"))
+
+FACE_MATCH_THRESHOLD = float(os.getenv("FACE_CONFIDENCE_THRESHOLD", "0.7"))
+# Weaker matches are still reported as suggestions for the labelling UI
+SUGGESTION_THRESHOLD = 0.5
+MATCH_CANDIDATES = 3
+# Photos per job when re-queueing detection that a restart interrupted
+REQUEUE_BATCH_SIZE = 32
+
+# Face analysis model owned by the current worker process
+_worker_service = None
+
+def _init_worker():
+    """Load a private face analysis model in each worker process"""
+    global _worker_service
+    from services.gallery_face_service import GalleryFaceService
+    _worker_service = GalleryFaceService(load_index=False)
+    _worker_service.load_model()
+
+def _worker_ready() -> bool:
+    return _worker_service is not None
+
+def _detect_photos(sources: List[Union[str, np.ndarray]], scales: List[float]) -> List[Optional[List[dict]]]:
+    """Detect faces for a batch of photos inside a worker process"""
+    try:
+        return _worker_service.detect_faces_in_photos(sources, scales=scales)
+    except Exception as e:
+        print(f"Batched face detection failed, retrying photos one by one: {e}")
+    
+    results = []
+    for source, scale in zip(sources, scales):
+        try:
+            results.append(_worker_service.detect_faces_in_photo(source, scale))
+        except Exception as e:
+            print(f"Face detection error for {source if isinstance(source, str) else 'decoded image'}: {e}")
+            results.append(None)
+    return results
+
+class QueueFullError(Exception):
+    """Raised when the detection queue cannot accept more photos"""
+
+class FaceDetectionQueue:
+    """Runs face detection in a bounded pool of worker processes"""
+
+    def __init__(self, face_service, workers: int = DETECTION_WORKERS, max_pending: int = DETECTION_MAX_PENDING):
+        self.face_service = face_service
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.capacity_freed = asyncio.Event()
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.tasks = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.executor_lock:
+            if self.executor is None:
+                # Spawn instead of fork so workers don't inherit ONNX Runtime state
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            return self.executor
+
+    def warm_up(self):
+        """Start every worker and load its model now, so the first upload doesn't wait for it"""
+        executor = self._get_executor()
+        # Each submit beyond the idle workers spawns another process, up to `workers`
+        futures = [executor.submit(_worker_ready) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def has_capacity(self, count: int = 1) -> bool:
+        """Check whether `count` more photos fit in the queue"""
+        return self.pending + count <= self.max_pending
+
+    async def wait_for_capacity(self, count: int = 1):
+        """Wait until `count` more photos fit in the queue"""
+        while not self.has_capacity(count):
+            self.capacity_freed.clear()
+            await self.capacity_freed.wait()
+
+    def submit(self, user_id: int, photos: List[Tuple[int, Union[str, np.ndarray], float]]) -> str:
+        """Queue (photo_id, source, scale) entries for detection and return the job id.
+
+        The source is a file path, or an image already decoded by the upload
+        handler together with its size relative to the original photo.
+        Must be called from the event loop.
+        """
+        if not self.has_capacity(len(photos)):
+            raise QueueFullError(f"Detection queue is full ({self.pending}/{self.max_pending} photos pending)")
+
+        job_id = job_registry.create(
+            'face_detection',
+            user_id,
+            photo_ids=[photo[0] for photo in photos],
+            total=len(photos),
+            processed=0
+        )
+        self.pending += len(photos)
+
+        task = asyncio.get_running_loop().create_task(self._run(job_id, photos))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job_id
+
+    def _load_unfinished(self) -> List[Tuple[int, int, str]]:
+        db = SessionLocal()
+        try:
+            return db.query(Photo.id, Photo.user_id, Photo.file_path).filter(
+                Photo.faces_status.in_(('pending', 'processing'))
+            ).order_by(Photo.id).all()
+        finally:
+            db.close()
+
+    async def requeue_unfinished(self) -> List[str]:
+        """Queue every photo still waiting for detection and return the job ids.
+
+        Jobs only live in memory, so photos a restart or a crashed worker left
+        pending or processing are never picked up otherwise. Saving results is
+        idempotent, so a photo queued twice still gets its faces once.
+        Must be called from the event loop.
+        """
+        by_user: Dict[int, List[Tuple[int, str, float]]] = {}
+        for photo_id, user_id, file_path in await run_in_threadpool(self._load_unfinished):
+            by_user.setdefault(user_id, []).append((photo_id, file_path, 1.0))
+
+        batch_size = min(REQUEUE_BATCH_SIZE, self.max_pending)
+        job_ids = []
+        for user_id, photos in by_user.items():
+            for start in range(0, len(photos), batch_size):
+                batch = photos[start:start + batch_size]
+                await self.wait_for_capacity(len(batch))
+                job_ids.append(self.submit(user_id, batch))
+        return job_ids
+
+    async def _run(self, job_id: str, photos: List[Tuple[int, Union[str, np.ndarray], float]]):
+        photo_ids = [photo[0] for photo in photos]
+        try:
+            # Files seen before with the current model skip inference entirely
+            cached = await run_in_threadpool(self._load_cached, photo_ids)
+            job_registry.update(job_id, status='processing', cached=len(cached))
+            await run_in_threadpool(self._set_status, photo_ids, 'processing')
+
+            misses = [photo for photo in photos if photo[0] not in cached]
+            detected = {}
+            if misses:
+                loop = asyncio.get_running_loop()
+                try:
+                    results = await loop.run_in_executor(
+                        self._get_executor(), _detect_photos,
+                        [source for _, source, _ in misses], [scale for _, _, scale in misses]
+                    )
+                except BrokenProcessPool:
+                    # A worker died; start a fresh pool for the next job
+                    self.executor = None
+                    raise
+                detected = {photo_id: faces_data for (photo_id, _, _), faces_data in zip(misses, results)}
+
+            results = [cached[photo_id] if photo_id in cached else detected[photo_id] for photo_id in photo_ids]
+            saved = await run_in_threadpool(self._save_results, photo_ids, results, set(detected))
+            crops = saved.pop('crops')
+            job_registry.update(job_id, status='completed', processed=len(photos), **saved)
+            
+            for source_path, content_hash, bboxes in crops:
+                await run_in_threadpool(derivative_service.generate_face_crops, source_path, content_hash, bboxes)
+        except Exception as e:
+            print(f"Detection job {job_id} failed: {e}")
+            job_registry.update(job_id, status='failed', error=str(e))
+            try:
+                await run_in_threadpool(self._set_status, photo_ids, 'failed')
+            except Exception as status_err:
+                print(f"Failed to mark photos as failed: {status_err}")
+        finally:
+            self.pending -= len(photos)
+            self.capacity_freed.set()
+
+    def _set_status(self, photo_ids: List[int], status: str):
+        db = SessionLocal()
+        try:
+            # A photo detected by another job keeps its result
+            db.query(Photo).filter(
+                Photo.id.in_(photo_ids),
+                Photo.faces_status != 'ready'
+            ).update({'faces_status': status}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _load_cached(self, photo_ids: List[int]) -> Dict[int, List[dict]]:
+        """Cached detection results for the photos whose content was seen before"""
+        db = SessionLocal()
+        try:
+            hashes = dict(db.query(Photo.id, Photo.content_hash).filter(
+                Photo.id.in_(photo_ids),
+                Photo.content_hash.isnot(None)
+            ).all())
+            cached = load_cached_detections(db, hashes.values())
+            return {photo_id: cached[content_hash] for photo_id, content_hash in hashes.items() if content_hash in cached}
+        finally:
+            db.close()
+
+    def _save_results(self, photo_ids: List[int], results: List[Optional[List[dict]]], fresh_ids: Set[int]) -> Dict:
+        """Store detected faces, match them to known persons and mark photos ready.
+
+        Results for `fresh_ids` came from the model and are added to the detection cache.
+        """
+        db = SessionLocal()
+        try:
+            # Locked so two jobs holding the same photo can't both store its faces
+            photo_rows = {p.id: p for p in db.query(Photo).filter(Photo.id.in_(photo_ids)).with_for_update().all()}
+            detected = []
+            
+            for photo_id, faces_data in zip(photo_ids, results):
+                photo = photo_rows.get(photo_id)
+                if not photo or photo.faces_status == 'ready':
+                    # Deleted while it was queued, or already detected by another job
+                    continue
+                
+                if faces_data is None:
+                    photo.faces_status = 'failed'
+                    continue
+                
+                photo.faces_count = len(faces_data)
+                photo.faces_status = 'ready'
+                if photo_id in fresh_ids and photo.content_hash:
+                    store_detections(db, photo.content_hash, faces_data)
+                detected.extend((photo, face_data) for face_data in faces_data)
+            
+            # One vectorized search per user for every face in the job
+            candidates = [[] for _ in detected]
+            for user_id in {photo.user_id for photo, _ in detected}:
+                positions = [i for i, (photo, _) in enumerate(detected) if photo.user_id == user_id]
+                embeddings = np.vstack([detected[i][1]['embedding'] for i in positions])
+                for i, matches in zip(positions, self.face_service.search_persons(
+                    embeddings, user_id, k=MATCH_CANDIDATES, threshold=SUGGESTION_THRESHOLD
+                )):
+                    candidates[i] = matches
+            
+            person_matches = [matches[0] if matches and matches[0]['similarity'] >= FACE_MATCH_THRESHOLD else None for matches in candidates]
+            lock_persons(db, {match['person_id'] for match in person_matches if match})
+            
+            faces = []
+            for (photo, face_data), person_match in zip(detected, person_matches):
+                face = Face(
+                    photo_id=photo.id,
+                    person_id=person_match['person_id'] if person_match else None,
+                    bbox_x=face_data['bbox']['x'],
+                    bbox_y=face_data['bbox']['y'],
+                    bbox_width=face_data['bbox']['width'],
+                    bbox_height=face_data['bbox']['height'],
+                    confidence=face_data['confidence'],
+                    embedding=encode_embedding(face_data['embedding']),
+                    is_verified=bool(person_match)
+                )
+                db.add(face)
+                faces.append(face)
+            
+            # Faces nobody recognised join a suggested cluster when one is close enough
+            for user_id in {photo.user_id for photo, _ in detected}:
+                positions = [i for i, (photo, _) in enumerate(detected) if photo.user_id == user_id and faces[i].person_id is None]
+                if not positions:
+                    continue
+                cluster_ids = fold_into_clusters(db, user_id, np.vstack([detected[i][1]['embedding'] for i in positions]))
+                for i, cluster_id in zip(positions, cluster_ids):
+                    faces[i].cluster_id = cluster_id
+            
+            db.flush()
+            refresh_person_stats(db, {face.person_id for face in faces})
+            matches_summary = [{
+                'face_id': face.id,
+                'photo_id': face.photo_id,
+                'person_id': face.person_id,
+                'cluster_id': face.cluster_id,
+                'candidates': [{
+                    'person_id': match['person_id'],
+                    'name': match['name'],
+                    'similarity': match['similarity']
+                } for match in matches]
+            } for face, matches in zip(faces, candidates)]
+            
+            crops = {}
+            for face in faces:
+                photo = photo_rows[face.photo_id]
+                if photo.content_hash:
+                    crops.setdefault(photo.id, (photo.file_path, photo.content_hash, []))[2].append(
+                        (face.bbox_x, face.bbox_y, face.bbox_width, face.bbox_height)
+                    )
+            
+            db.commit()
+            return {'faces_count': len(faces), 'faces': matches_summary, 'crops': list(crops.values())}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,608 @@
+import faiss
+import numpy as np
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services import ann_index
+from services.ann_index import FACE_INDEX_BACKEND, FACE_INDEX_TRAIN_THRESHOLD
+from services.index_store import ShardStore, decode_array, encode_array, file_lock
+from services.person_model import PersonModel, PERSON_PROTOTYPES, PROTOTYPE_SLOTS
+
+INDEX_DIR = "./gallery_index"
+FACE_INDEX_MEMORY_MB = int(os.getenv("FACE_INDEX_MEMORY_MB", "512"))
+
+# Approximate results are re-scored against exact vectors from this many candidates per hit
+ANN_RERANK_FACTOR = 4
+# Rebuild HNSW once this share of its vectors are outdated copies
+ANN_MAX_STALE_RATIO = 0.25
+# Rebuilds restart when another worker compacts the shard mid-build
+REBUILD_ATTEMPTS = 3
+
+class UserFaceIndex:
+    """FAISS index and person mappings for a single user"""
+
+    def __init__(self, user_id: int, embedding_dim: int, directory: str, backend: str = FACE_INDEX_BACKEND):
+        self.user_id = user_id
+        self.embedding_dim = embedding_dim
+        self.directory = directory
+        self.backend = backend
+        self.store = ShardStore(directory)
+        self.lock = threading.RLock()
+        self.replaying = False
+        # Set while a rebuild runs so changes made meanwhile can be carried over
+        self.changes: Optional[List[Dict]] = None
+        # Bumped whenever another process's snapshot replaced the in-memory state
+        self.reloads = 0
+
+        # Each person owns a block of PROTOTYPE_SLOTS vector ids, so edits never shift other rows.
+        # The exact index stays the source of truth; the optional ANN index only accelerates search.
+        self.index = self._new_index()
+        self.person_mappings: Dict[int, Dict] = {}
+        self.person_models: Dict[int, PersonModel] = {}
+        self.ann = None
+        self.ann_trained_size = 0
+        self.ann_stale = 0
+
+    def _new_index(self):
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(self.embedding_dim))
+
+    def _adopt(self, other: "UserFaceIndex"):
+        """Take over the in-memory state of a shard built off to the side"""
+        self.index = other.index
+        self.person_mappings = other.person_mappings
+        self.person_models = other.person_models
+        self.ann = other.ann
+        self.ann_trained_size = other.ann_trained_size
+        self.ann_stale = other.ann_stale
+
+    def _reset(self):
+        self.index = self._new_index()
+        self.person_mappings = {}
+        self.person_models = {}
+        self.ann = None
+        self.ann_trained_size = 0
+        self.ann_stale = 0
+
+    @contextmanager
+    def _writing(self):
+        """Serialize a change with other threads and worker processes, on top of their latest changes"""
+        with self.lock:
+            if self.replaying:
+                yield
+            else:
+                with self.store.locked():
+                    self.refresh()
+                    yield
+
+    def refresh(self):
+        """Catch up with changes other worker processes made to the shard"""
+        with self.lock:
+            state = self.store.poll()
+            if state == 'reload':
+                self._reset()
+                self._load_store()
+                self.reloads += 1
+            elif state == 'tail':
+                self._replay()
+
+    def memory_bytes(self) -> int:
+        size = self.index.ntotal * self.embedding_dim * 4
+        if self.ann is not None:
+            size += ann_index.ann_memory_bytes(self.backend, self.ann.ntotal, self.embedding_dim)
+        return size
+
+    def _is_live(self, vector_id: int) -> bool:
+        """Whether a vector id still belongs to a current prototype"""
+        person_id, slot = divmod(vector_id, PROTOTYPE_SLOTS)
+        model = self.person_models.get(person_id)
+        return model is not None and slot < model.prototype_count()
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (distances, vector_ids) of the k nearest prototypes, padded with -1"""
+        k = min(k, self.index.ntotal)
+        if self.ann is None:
+            return self.index.search(queries, k)
+
+        ann_index.set_search_params(self.ann, **ann_index.search_params)
+        _, candidates = self.ann.search(queries, k * ANN_RERANK_FACTOR)
+
+        # Re-score candidates exactly: PQ distances are approximate and HNSW may hold outdated copies
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, query in enumerate(queries):
+            unique_ids = [int(i) for i in dict.fromkeys(candidates[row]) if i >= 0 and self._is_live(int(i))]
+            if not unique_ids:
+                continue
+            vectors = np.vstack([self.index.reconstruct(i) for i in unique_ids])
+            exact = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            ids[row, :len(order)] = np.array(unique_ids)[order]
+        return distances, ids
+
+    def search_many(self, queries: np.ndarray, k: int, threshold: float) -> List[List[Dict]]:
+        """Top-k persons at or above threshold for each normalized query row.
+
+        A person scores as its best-matching prototype.
+        """
+        with self.lock:
+            if self.index.ntotal == 0:
+                return [[] for _ in range(len(queries))]
+
+            # Enough prototype hits to still find k distinct persons
+            distances, ids = self._search(queries, k * (PERSON_PROTOTYPES + 1))
+
+            similarities = 1 - (distances * distances / 2)
+            similarities = np.clip(similarities, 0, 1)
+
+            results = []
+            for row_similarities, row_ids in zip(similarities, ids):
+                matches = {}
+                # Hits come nearest first, so the first hit per person is its max over prototypes
+                for similarity, vector_id in zip(row_similarities, row_ids):
+                    if vector_id < 0 or similarity < threshold or len(matches) == k:
+                        break
+                    person_id = int(vector_id) // PROTOTYPE_SLOTS
+                    if person_id not in matches and person_id in self.person_mappings:
+                        match = self.person_mappings[person_id].copy()
+                        match['similarity'] = float(similarity)
+                        matches[person_id] = match
+                results.append(list(matches.values()))
+            return results
+
+    def _log(self, record: Dict):
+        if not self.replaying:
+            self.store.append(record)
+            if self.changes is not None:
+                self.changes.append(record)
+
+    def add(self, person_id: int, embeddings_norm: np.ndarray, mapping: Dict):
+        """Insert or replace a person, seeding its prototypes from one or more faces"""
+        embeddings_norm = np.asarray(embeddings_norm, dtype=np.float32).reshape(-1, self.embedding_dim)
+        with self._writing():
+            self._log({'op': 'add', 'person_id': person_id, 'mapping': mapping, 'embeddings': encode_array(embeddings_norm)})
+            model = PersonModel(self.embedding_dim)
+            model.add_faces(embeddings_norm)
+            self._set_model(person_id, model)
+            self.person_mappings[person_id] = mapping
+            self._maybe_train()
+
+    def _set_model(self, person_id: int, model: PersonModel):
+        """Swap a person's prototype vectors in the exact and approximate indexes"""
+        if person_id in self.person_models:
+            self._remove_vectors(person_id)
+
+        vectors = np.ascontiguousarray(model.prototypes(), dtype=np.float32)
+        ids = PersonModel.vector_ids(person_id, len(vectors))
+        self.index.add_with_ids(vectors, ids)
+        if self.ann is not None:
+            self.ann.add_with_ids(vectors, ids)
+        self.person_models[person_id] = model
+
+    def _remove_vectors(self, person_id: int):
+        ids = PersonModel.vector_ids(person_id, self.person_models[person_id].prototype_count())
+        self.index.remove_ids(ids)
+        self._ann_remove(ids)
+
+    def _ann_remove(self, ids: np.ndarray):
+        if self.ann is not None and not ann_index.remove_ids(self.ann, ids):
+            # HNSW can't delete; the outdated copy is filtered out during re-scoring
+            self.ann_stale += len(ids)
+
+    def _maybe_train(self):
+        """(Re)build the approximate index once the shard outgrows exact search"""
+        if self.backend == "flat":
+            return
+
+        ntotal = self.index.ntotal
+        if ntotal < FACE_INDEX_TRAIN_THRESHOLD:
+            if self.ann is not None and ntotal < FACE_INDEX_TRAIN_THRESHOLD // 2:
+                self.ann = None
+            return
+
+        needs_build = (
+            self.ann is None
+            # IVF centroids drift out of date as the shard grows
+            or (self.backend != "hnsw" and ntotal >= 2 * self.ann_trained_size)
+            or self.ann_stale > ANN_MAX_STALE_RATIO * ntotal
+        )
+        if needs_build:
+            self.build_ann()
+
+    def build_ann(self):
+        """Train a fresh approximate index from the exact vectors"""
+        with self.lock:
+            ntotal = self.index.ntotal
+            ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+            vectors = self.index.index.reconstruct_n(0, ntotal)
+
+            self.ann = ann_index.build_ann_index(self.backend, vectors, ids)
+            self.ann_trained_size = ntotal
+            self.ann_stale = 0
+            print(f"Built {self.backend} index for user {self.user_id} over {ntotal} persons")
+
+    def update_mapping(self, person_id: int, **fields) -> bool:
+        with self._writing():
+            mapping = self.person_mappings.get(person_id)
+            if mapping is None:
+                return False
+            self._log({'op': 'mapping', 'person_id': person_id, 'fields': fields})
+            mapping.update(fields)
+            return True
+
+    def prototypes_for(self, person_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """Stacked prototype vectors of the given persons and the person id of each row"""
+        with self.lock:
+            models = [(person_id, self.person_models[person_id]) for person_id in person_ids if person_id in self.person_models]
+            if not models:
+                return np.zeros((0, self.embedding_dim), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+            vectors = np.vstack([model.prototypes() for _, model in models])
+            owners = np.concatenate([np.full(model.prototype_count(), person_id, dtype=np.int64) for person_id, model in models])
+            return vectors, owners
+
+    def delete_person(self, person_id: int) -> bool:
+        with self._writing():
+            if person_id not in self.person_mappings:
+                return False
+
+            self._log({'op': 'delete', 'person_id': person_id})
+            if person_id in self.person_models:
+                self._remove_vectors(person_id)
+                del self.person_models[person_id]
+            del self.person_mappings[person_id]
+            self._maybe_train()
+            return True
+
+    def update_person_embedding(self, person_id: int, new_embedding: np.ndarray) -> bool:
+        """Fold a single new face into the person's prototypes"""
+        return self.update_person_embeddings(person_id, new_embedding.reshape(1, -1))
+
+    def update_person_embeddings(self, person_id: int, new_embeddings: np.ndarray) -> bool:
+        """Fold several new faces into the person's prototypes in one update"""
+        with self._writing():
+            model = self.person_models.get(person_id)
+            if person_id not in self.person_mappings or model is None:
+                return False
+
+            new_embeddings = np.asarray(new_embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+            self._log({'op': 'update', 'person_id': person_id, 'embeddings': encode_array(new_embeddings)})
+            # Old prototype ids must be known before the model changes shape
+            self._remove_vectors(person_id)
+            del self.person_models[person_id]
+            model.add_faces(new_embeddings)
+            self._set_model(person_id, model)
+            self._maybe_train()
+            return True
+
+    def load_models(self, person_models: Dict[int, PersonModel], person_mappings: Dict[int, Dict]):
+        """Replace the shard contents with prebuilt person models, bulk-loading the index"""
+        with self.lock:
+            self.person_models = dict(person_models)
+            self.person_mappings = dict(person_mappings)
+            self.ann = None
+            self._rebuild_index()
+            self._maybe_train()
+
+    def _rebuild_index(self):
+        """Bulk-load the exact index from the person models in one add"""
+        self.index = self._new_index()
+        if not self.person_models:
+            return
+
+        vectors, ids = [], []
+        for person_id, model in self.person_models.items():
+            prototypes = model.prototypes()
+            vectors.append(prototypes)
+            ids.append(PersonModel.vector_ids(person_id, len(prototypes)))
+        self.index.add_with_ids(np.ascontiguousarray(np.vstack(vectors), dtype=np.float32), np.concatenate(ids))
+
+    def save(self):
+        """Compact the log into a snapshot once it is long; each change is already durable in the log"""
+        with self._writing():
+            if self.store.needs_compaction():
+                self.snapshot()
+
+    def snapshot(self):
+        """Write every person model and mapping as a new atomic snapshot"""
+        with self.lock, self.store.locked():
+            persons = []
+            centroids, medoids, weights = [], [], []
+            for person_id, model in self.person_models.items():
+                persons.append({
+                    'person_id': person_id,
+                    'mapping': self.person_mappings[person_id],
+                    'count': model.count,
+                    'medoids': len(model.medoids)
+                })
+                centroids.append(model.centroid_sum)
+                medoids.append(model.medoids)
+                weights.append(model.weights)
+
+            arrays = {
+                'centroids': np.vstack(centroids) if centroids else np.zeros((0, self.embedding_dim), dtype=np.float32),
+                'medoids': np.vstack(medoids) if medoids else np.zeros((0, self.embedding_dim), dtype=np.float32),
+                'weights': np.concatenate(weights) if weights else np.zeros(0, dtype=np.int64)
+            }
+            meta = {
+                'user_id': self.user_id,
+                'embedding_dim': self.embedding_dim,
+                'ann_backend': self.backend if self.ann is not None else None,
+                'ann_trained_size': self.ann_trained_size,
+                'persons': persons
+            }
+            self.store.write_snapshot(meta, arrays, self.ann)
+
+    def load(self):
+        """Load the live snapshot, memory-mapped, and replay the log written after it.
+
+        Failures are raised instead of starting empty, so a damaged shard is
+        never silently replaced by a blank one.
+        """
+        with self.lock:
+            try:
+                if self.store.snapshot_name() is None and os.path.exists(os.path.join(self.directory, "person_mappings.pkl")):
+                    with self.store.locked():
+                        # Another worker may have converted the files while we waited
+                        if self.store.snapshot_name() is None:
+                            self._migrate_pickle_files()
+                            self._reset()
+                self._load_store()
+            except Exception as e:
+                print(f"Error loading index for user {self.user_id}: {e}")
+                raise
+
+    def _load_store(self):
+        snapshot = self.store.read_snapshot()
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+        self._replay()
+        self._maybe_train()
+
+    def _replay(self):
+        """Apply log records this process has not seen yet"""
+        self.replaying = True
+        try:
+            for record in self.store.replay():
+                self._apply(record)
+                if self.changes is not None:
+                    self.changes.append(record)
+        finally:
+            self.replaying = False
+
+    def _load_snapshot(self, snapshot: Dict):
+        meta = snapshot['meta']
+        centroids, medoids, weights = snapshot['centroids'], snapshot['medoids'], snapshot['weights']
+
+        offset = 0
+        for row, person in enumerate(meta['persons']):
+            count = person['medoids']
+            model = PersonModel(self.embedding_dim)
+            # Centroid sums and weights change in place, so they get private copies;
+            # medoids are only ever replaced and stay memory-mapped
+            model.centroid_sum = np.array(centroids[row], dtype=np.float32)
+            model.count = person['count']
+            model.medoids = medoids[offset:offset + count]
+            model.weights = np.array(weights[offset:offset + count], dtype=np.int64)
+            offset += count
+
+            self.person_models[person['person_id']] = model
+            self.person_mappings[person['person_id']] = person['mapping']
+
+        self._rebuild_index()
+        if snapshot['ann'] is not None and meta.get('ann_backend') == self.backend:
+            self.ann = snapshot['ann']
+            self.ann_trained_size = meta.get('ann_trained_size', self.ann.ntotal)
+
+    def _apply(self, record: Dict):
+        """Re-run one logged change"""
+        op, person_id = record['op'], record['person_id']
+        if op == 'add':
+            self.add(person_id, decode_array(record['embeddings']), record['mapping'])
+        elif op == 'update':
+            self.update_person_embeddings(person_id, decode_array(record['embeddings']))
+        elif op == 'mapping':
+            self.update_mapping(person_id, **record['fields'])
+        elif op == 'delete':
+            self.delete_person(person_id)
+        else:
+            raise ValueError(f"Unknown index log operation {op!r}")
+
+    def _migrate_pickle_files(self):
+        """Convert a shard saved as a FAISS file plus pickled mappings into a snapshot"""
+        index_path = os.path.join(self.directory, "person_embeddings.index")
+        mappings_path = os.path.join(self.directory, "person_mappings.pkl")
+        models_path = os.path.join(self.directory, "person_models.pkl")
+
+        with open(mappings_path, "rb") as f:
+            self.person_mappings = pickle.load(f)
+
+        if os.path.exists(models_path):
+            with open(models_path, "rb") as f:
+                self.person_models = pickle.load(f)
+            self._rebuild_index()
+        else:
+            if os.path.exists(index_path):
+                self.index = faiss.read_index(index_path)
+            self.replaying = True
+            try:
+                self._convert_single_vector_index()
+            finally:
+                self.replaying = False
+
+        self.snapshot()
+        for path in os.listdir(self.directory):
+            if path.endswith((".index", ".pkl")):
+                os.replace(os.path.join(self.directory, path), os.path.join(self.directory, path + ".migrated"))
+        print(f"Converted face index for user {self.user_id} to snapshot + log storage")
+
+    def _convert_single_vector_index(self):
+        """Turn an index holding one vector per person into prototype models.
+
+        Older shards keyed vectors by row position, newer ones by person_id.
+        """
+        old_index, old_mappings = self.index, self.person_mappings
+        self.index = self._new_index()
+        self.person_mappings = {}
+        self.person_models = {}
+        self.ann = None
+
+        for key, mapping in old_mappings.items():
+            person_id = mapping.get('person_id')
+            if person_id is None:
+                continue
+            try:
+                vector = old_index.reconstruct(int(key))
+            except RuntimeError:
+                continue
+            self.add(person_id, vector, mapping)
+
+class FaceIndexManager:
+    """Keeps one index shard per user, loaded lazily and evicted LRU under a memory budget"""
+
+    def __init__(self, embedding_dim: int, index_dir: str = INDEX_DIR, memory_budget_mb: int = FACE_INDEX_MEMORY_MB):
+        self.embedding_dim = embedding_dim
+        self.index_dir = index_dir
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.shards: "OrderedDict[int, UserFaceIndex]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.rebuilding = set()
+
+        self._migrate_legacy_index()
+
+    def _shard_dir(self, user_id: int) -> str:
+        return os.path.join(self.index_dir, "users", str(user_id))
+
+    def get(self, user_id: int) -> UserFaceIndex:
+        """Return the user's shard, loading it from disk on first use.
+
+        A cached shard first picks up changes other worker processes made.
+        """
+        with self.lock:
+            shard = self.shards.get(user_id)
+            if shard is None:
+                shard = UserFaceIndex(user_id, self.embedding_dim, self._shard_dir(user_id))
+                shard.load()
+                self.shards[user_id] = shard
+                self._evict(keep=user_id)
+                return shard
+            self.shards.move_to_end(user_id)
+
+        # Outside the manager lock so a reload doesn't stall other users
+        shard.refresh()
+        return shard
+
+    def memory_bytes(self) -> int:
+        return sum(shard.memory_bytes() for shard in self.shards.values())
+
+    def new_shard(self, user_id: int) -> UserFaceIndex:
+        """An empty, unregistered shard for building a replacement off to the side"""
+        return UserFaceIndex(user_id, self.embedding_dim, self._shard_dir(user_id))
+
+    def rebuild(self, user_id: int, build: Callable[[], UserFaceIndex]) -> UserFaceIndex:
+        """Build a replacement shard off to the side and swap its contents in.
+
+        Searches keep using the current shard while `build` runs. Changes made
+        meanwhile, by this or another worker process, are re-applied on top
+        of the rebuilt state before it replaces the live snapshot.
+        """
+        try:
+            shard = self.get(user_id)
+        except Exception as e:
+            # An unreadable shard is exactly what a rebuild repairs
+            print(f"Rebuilding unreadable face index for user {user_id}: {e}")
+            new = build()
+            with new.lock, new.store.locked():
+                new.store.seq = new.store.last_logged_seq()
+                new.snapshot()
+            with self.lock:
+                self.shards[user_id] = new
+            return new
+
+        with self.lock:
+            self.rebuilding.add(user_id)
+        try:
+            for attempt in range(REBUILD_ATTEMPTS):
+                with shard.lock:
+                    shard.changes = []
+                    reloads = shard.reloads
+                new = build()
+
+                with shard.lock, shard.store.locked():
+                    shard.refresh()
+                    changes, shard.changes = shard.changes, None
+                    if shard.reloads != reloads and attempt + 1 < REBUILD_ATTEMPTS:
+                        # Another worker compacted the log, so the recorded changes may be incomplete
+                        continue
+
+                    # Swap contents rather than objects so callers holding the shard stay valid
+                    shard._adopt(new)
+                    shard.replaying = True
+                    try:
+                        for record in changes:
+                            shard._apply(record)
+                    finally:
+                        shard.replaying = False
+                    # The snapshot supersedes everything logged before it, in every process
+                    shard.snapshot()
+                    return shard
+        finally:
+            with self.lock:
+                self.rebuilding.discard(user_id)
+
+    def _evict(self, keep: int):
+        """Drop least recently used shards until loaded shards fit the budget"""
+        for user_id in list(self.shards.keys()):
+            if self.memory_bytes() <= self.memory_budget:
+                break
+            if user_id == keep or user_id in self.rebuilding:
+                continue
+
+            shard = self.shards[user_id]
+            # Every change is logged as it happens, so only idle shards can be dropped safely
+            if shard.lock.acquire(blocking=False):
+                try:
+                    del self.shards[user_id]
+                finally:
+                    shard.lock.release()
+
+    def _migrate_legacy_index(self):
+        """Split the old install-wide index into per-user shards"""
+        legacy_index_path = os.path.join(self.index_dir, "person_embeddings.index")
+        legacy_mappings_path = os.path.join(self.index_dir, "person_mappings.pkl")
+        if not (os.path.exists(legacy_index_path) and os.path.exists(legacy_mappings_path)):
+            return
+
+        # Every API worker starts here; only the first one to get the lock migrates
+        with file_lock(os.path.join(self.index_dir, "LOCK")):
+            if os.path.exists(legacy_mappings_path):
+                self._split_legacy_index(legacy_index_path, legacy_mappings_path)
+
+    def _split_legacy_index(self, legacy_index_path: str, legacy_mappings_path: str):
+        try:
+            legacy_index = faiss.read_index(legacy_index_path)
+            with open(legacy_mappings_path, "rb") as f:
+                legacy_mappings = pickle.load(f)
+        except Exception as e:
+            print(f"Error reading legacy index, skipping migration: {e}")
+            return
+
+        shards = {}
+        for idx, mapping in legacy_mappings.items():
+            if idx >= legacy_index.ntotal or mapping.get('user_id') is None or mapping.get('person_id') is None:
+                continue
+            user_id = mapping['user_id']
+            if user_id not in shards:
+                shards[user_id] = UserFaceIndex(user_id, self.embedding_dim, self._shard_dir(user_id))
+            shards[user_id].add(mapping['person_id'], legacy_index.reconstruct(idx), mapping)
+
+        for shard in shards.values():
+            shard.snapshot()
+
+        os.replace(legacy_index_path, legacy_index_path + ".migrated")
+        os.replace(legacy_mappings_path, legacy_mappings_path + ".migrated")
+        print(f"Migrated legacy face index into {len(shards)} user shards")
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+
+from connection import SessionLocal
+from models import Face, Photo
+from services.face_detection_queue import FACE_MATCH_THRESHOLD
+from services.job_registry import job_registry
+from services.person_stats import lock_persons, refresh_person_stats
+from services.person_model import normalize_rows
+from utils.embeddings import EMBEDDING_DIM, decode_embedding
+
+REMATCH_CHUNK_SIZE = int(os.getenv("FACE_REMATCH_CHUNK_SIZE", "4096"))
+
+# Persons waiting for a user's rematch job that has not started yet
+_pending: Dict[int, Tuple[str, Set[int]]] = {}
+_pending_lock = threading.Lock()
+
+def schedule_rematch(user_id: int, person_ids: Iterable[int]) -> Tuple[str, bool]:
+    """Queue persons for re-matching; returns (job_id, is_new_job).
+
+    Requests arriving before the user's queued job starts are folded into it,
+    so a burst of labelling triggers one scan instead of one per click.
+    """
+    with _pending_lock:
+        if user_id in _pending:
+            job_id, queued = _pending[user_id]
+            queued.update(person_ids)
+            return job_id, False
+
+        job_id = job_registry.create('face_rematch', user_id, processed=0, total=0, matched=0)
+        _pending[user_id] = (job_id, set(person_ids))
+        return job_id, True
+
+def _load_unassigned(db: Session, user_id: int, path: str) -> Tuple[np.memmap, np.ndarray]:
+    """Stream the user's unassigned embeddings into a memory-mapped matrix"""
+    query = db.query(Face.id, Face.embedding).join(Photo).filter(
+        Photo.user_id == user_id,
+        Face.person_id.is_(None)
+    ).order_by(Face.id)
+
+    count = query.count()
+    if count == 0:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    matrix = np.memmap(path, dtype=np.float32, mode='w+', shape=(count, EMBEDDING_DIM))
+    face_ids = np.zeros(count, dtype=np.int64)
+    loaded = 0
+    for face_id, blob in query.yield_per(REMATCH_CHUNK_SIZE):
+        # Faces added after the count are left for the next scan
+        if loaded == count:
+            break
+        matrix[loaded] = decode_embedding(blob)
+        face_ids[loaded] = face_id
+        loaded += 1
+    matrix.flush()
+    return matrix[:loaded], face_ids[:loaded]
+
+def rematch_faces(db: Session, user_id: int, prototypes: np.ndarray, owners: np.ndarray, job_id: Optional[str] = None) -> Dict:
+    """Assign unassigned faces whose best prototype clears the match threshold.
+
+    `prototypes` holds normalized person vectors and `owners` the person id of each row.
+    """
+    fd, path = tempfile.mkstemp(prefix=f"rematch_{user_id}_", suffix=".f32")
+    os.close(fd)
+    try:
+        matrix, face_ids = _load_unassigned(db, user_id, path)
+        total = len(face_ids)
+        matched = 0
+        if job_id:
+            job_registry.update(job_id, total=total)
+
+        for start in range(0, total, REMATCH_CHUNK_SIZE):
+            chunk = normalize_rows(matrix[start:start + REMATCH_CHUNK_SIZE])
+            similarities = chunk @ prototypes.T
+            best = similarities.argmax(axis=1)
+            # Score exactly like UserFaceIndex.search_many so the threshold means the same thing
+            distances = 2 - 2 * similarities[np.arange(len(chunk)), best]
+            hits = np.flatnonzero(1 - distances * distances / 2 >= FACE_MATCH_THRESHOLD)
+
+            by_person: Dict[int, List[int]] = {}
+            for row in hits:
+                by_person.setdefault(int(owners[best[row]]), []).append(int(face_ids[start + row]))
+
+            lock_persons(db, by_person.keys())
+            for person_id, ids in by_person.items():
+                # Faces labelled while the scan ran keep their label
+                matched += db.query(Face).filter(
+                    Face.id.in_(ids),
+                    Face.person_id.is_(None)
+                ).update({
+                    'person_id': person_id,
+                    'is_verified': True,
+                    'cluster_id': None
+                }, synchronize_session=False)
+            refresh_person_stats(db, by_person.keys())
+            db.commit()
+
+            if job_id:
+                job_registry.update(job_id, processed=min(start + REMATCH_CHUNK_SIZE, total), matched=matched)
+
+        return {'total': total, 'matched': matched}
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_rematch_job(job_id: str, user_id: int, face_service):
+    """Background entry point: scan the user's unassigned faces against queued persons"""
+    with _pending_lock:
+        _, person_ids = _pending.pop(user_id, (job_id, set()))
+
+    job_registry.update(job_id, status='processing', person_ids=sorted(person_ids))
+    db = SessionLocal()
+    try:
+        prototypes, owners = face_service.person_prototypes(person_ids, user_id)
+        if len(prototypes) == 0:
+            job_registry.update(job_id, status='completed')
+            return
+
+        result = rematch_faces(db, user_id, prototypes, owners, job_id)
+        job_registry.update(job_id, status='completed', **result)
+    except Exception as e:
+        db.rollback()
+        print(f"Rematch job {job_id} failed: {e}")
+        job_registry.update(job_id, status='failed', error=str(e))
+    finally:
+        db.close()
@@ -1,181 +1,256 @@
 import cv2
 import numpy as np
 import os
-import faiss
-import pickle
-import json
-import uuid
-from typing import List, Dict, Tuple, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Union
 from insightface.app import FaceAnalysis
-from PIL import Image
+from insightface.model_zoo.scrfd import distance2bbox, distance2kps
+from insightface.utils import face_align
+
+from services.face_index_manager import FaceIndexManager
+
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", "8"))
+RECOGNITION_BATCH_SIZE = 64
+DECODE_THREADS = 8
 
 class GalleryFaceService:
-    def __init__(self):
-        self.app = FaceAnalysis(providers=['CPUExecutionProvider'])
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
+    def __init__(self, load_index: bool = True):
+        # The model pack loads on first detection; the API process only searches the index
+        self._app = None
+        self._app_lock = threading.Lock()
         
         self.embedding_dim = 512
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.person_mappings = {}
         
-        self.load_index()
+        # Detection-only instances (worker processes) never touch the index
+        self.index_manager = FaceIndexManager(self.embedding_dim) if load_index else None
+    
+    @property
+    def app(self) -> FaceAnalysis:
+        return self._app or self.load_model()
+    
+    def load_model(self) -> FaceAnalysis:
+        """Load and prepare the InsightFace models once"""
+        with self._app_lock:
+            if self._app is None:
+                app = FaceAnalysis(providers=['CPUExecutionProvider'])
+                app.prepare(ctx_id=0, det_size=(640, 640))
+                self._app = app
+            return self._app
+        
+    @staticmethod
+    def _load_image(source: Union[str, np.ndarray]) -> Optional[np.ndarray]:
+        """Accept a file path or an already decoded BGR array"""
+        return cv2.imread(source) if isinstance(source, str) else source
+    
+    def detect_faces_in_photo(self, source: Union[str, np.ndarray], scale: float = 1.0) -> List[Dict]:
+        """Detect all faces in a photo and return face data.
         
-    def detect_faces_in_photo(self, image_path: str) -> List[Dict]:
-        """Detect all faces in a photo and return face data"""
-        image = cv2.imread(image_path)
+        `scale` is the decoded size relative to the original photo; boxes are
+        reported in original photo coordinates.
+        """
+        image = self._load_image(source)
         if image is None:
             return []
             
         faces = self.app.get(image)
-        face_data = []
+        return [self._face_info(face.bbox, face.det_score, face.embedding, scale) for face in faces]
+    
+    def detect_faces_in_photos(self, sources: List[Union[str, np.ndarray]], batch_size: int = DETECTION_BATCH_SIZE,
+                               scales: Optional[List[float]] = None) -> List[List[Dict]]:
+        """Detect faces in many photos with batched model inference.
+        
+        Sources are file paths or decoded BGR arrays. Returns one face data
+        list per source, in the same order.
+        """
+        if not sources:
+            return []
+        scales = scales or [1.0] * len(sources)
+        
+        # cv2 releases the GIL while decoding, so threads decode in parallel
+        with ThreadPoolExecutor(max_workers=min(DECODE_THREADS, len(sources))) as pool:
+            images = list(pool.map(self._load_image, sources))
+        
+        results = [[] for _ in images]
+        valid = [i for i, image in enumerate(images) if image is not None]
+        rec_model = self.app.models['recognition']
         
-        for face in faces:
-            x1, y1, x2, y2 = face.bbox.astype(int)
+        for start in range(0, len(valid), batch_size):
+            chunk = valid[start:start + batch_size]
+            detections = self._detect_batch([images[i] for i in chunk])
             
-            face_info = {
-                'bbox': {
-                    'x': float(x1),
-                    'y': float(y1), 
-                    'width': float(x2 - x1),
-                    'height': float(y2 - y1)
-                },
-                'confidence': float(face.det_score),
-                'embedding': face.embedding.tolist()
-            }
-            face_data.append(face_info)
+            # Align every detected face of the batch for one recognition pass
+            crops, owners = [], []
+            for i, (det, kpss) in zip(chunk, detections):
+                for row, kps in zip(det, kpss):
+                    crops.append(face_align.norm_crop(images[i], landmark=kps, image_size=rec_model.input_size[0]))
+                    owners.append((i, row))
             
-        return face_data
+            for rec_start in range(0, len(crops), RECOGNITION_BATCH_SIZE):
+                embeddings = rec_model.get_feat(crops[rec_start:rec_start + RECOGNITION_BATCH_SIZE])
+                for (i, row), embedding in zip(owners[rec_start:rec_start + RECOGNITION_BATCH_SIZE], embeddings):
+                    results[i].append(self._face_info(row[:4], row[4], embedding, scales[i]))
+        
+        return results
     
-    def search_person(self, embedding: np.ndarray, threshold: float = 0.7) -> Optional[Dict]:
-        """Search for matching person using face embedding"""
-        if self.index.ntotal == 0:
-            return None
-            
-        query_norm = embedding / np.linalg.norm(embedding)
-        distances, indices = self.index.search(query_norm.reshape(1, -1), 1)
+    def _face_info(self, bbox: np.ndarray, score: float, embedding: np.ndarray, scale: float = 1.0) -> Dict:
+        x1, y1, x2, y2 = (bbox / scale).astype(int)
+        
+        return {
+            'bbox': {
+                'x': float(x1),
+                'y': float(y1), 
+                'width': float(x2 - x1),
+                'height': float(y2 - y1)
+            },
+            'confidence': float(score),
+            'embedding': np.asarray(embedding, dtype=np.float32).ravel()
+        }
+    
+    def _detect_batch(self, images: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run the detector on a list of images, returning (det, kpss) per image"""
+        det_model = self.app.det_model
+        
+        if not self._detector_supports_batch():
+            return [det_model.detect(image, max_num=0, metric='default') for image in images]
+        
+        input_size = det_model.input_size
+        letterboxed = [self._letterbox(image, input_size) for image in images]
+        blob = cv2.dnn.blobFromImages(
+            [canvas for canvas, _ in letterboxed],
+            1.0 / det_model.input_std,
+            input_size,
+            (det_model.input_mean, det_model.input_mean, det_model.input_mean),
+            swapRB=True
+        )
+        net_outs = det_model.session.run(det_model.output_names, {det_model.input_name: blob})
+        
+        return [self._decode_detections(net_outs, b, scale) for b, (_, scale) in enumerate(letterboxed)]
+    
+    def _detector_supports_batch(self) -> bool:
+        """Only detectors exported with batched outputs and a dynamic batch axis accept stacked inputs.
+        
+        The stock buffalo_l SCRFD has neither, so with it only recognition is batched.
+        """
+        det_model = self.app.det_model
+        batch_dim = det_model.session.get_inputs()[0].shape[0]
+        return bool(getattr(det_model, 'batched', False)) and not isinstance(batch_dim, int)
+    
+    @staticmethod
+    def _letterbox(image: np.ndarray, input_size: Tuple[int, int]) -> Tuple[np.ndarray, float]:
+        """Resize keeping aspect ratio and pad to the detector input size (same layout as SCRFD.detect)"""
+        input_width, input_height = input_size
+        im_ratio = float(image.shape[0]) / image.shape[1]
         
-        if len(distances[0]) > 0:
-            distance = distances[0][0]
-            idx = indices[0][0]
+        if im_ratio > float(input_height) / input_width:
+            new_height = input_height
+            new_width = int(new_height / im_ratio)
+        else:
+            new_width = input_width
+            new_height = int(new_width * im_ratio)
+        
+        canvas = np.zeros((input_height, input_width, 3), dtype=np.uint8)
+        canvas[:new_height, :new_width, :] = cv2.resize(image, (new_width, new_height))
+        return canvas, float(new_height) / image.shape[0]
+    
+    def _decode_detections(self, net_outs: List[np.ndarray], b: int, det_scale: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Decode one image of a batched SCRFD output into boxes and keypoints"""
+        det_model = self.app.det_model
+        fmc = det_model.fmc
+        input_width, input_height = det_model.input_size
+        scores_list, bboxes_list, kpss_list = [], [], []
+        
+        for idx, stride in enumerate(det_model._feat_stride_fpn):
+            scores = net_outs[idx][b]
+            bbox_preds = net_outs[idx + fmc][b] * stride
+            kps_preds = net_outs[idx + fmc * 2][b] * stride
             
-            similarity = 1 - (distance * distance / 2)
-            similarity = max(0, min(1, similarity))
+            anchor_centers = self._anchor_centers(input_height // stride, input_width // stride, stride)
+            pos_inds = np.where(scores >= det_model.det_thresh)[0]
             
-            if similarity >= threshold and idx in self.person_mappings:
-                result = self.person_mappings[idx].copy()
-                result['similarity'] = float(similarity)
-                return result
-                
-        return None
-    
-    def add_person(self, name: str, embedding: np.ndarray, user_id: int) -> str:
-        """Add new person to the face index"""
-        embedding_id = str(uuid.uuid4())
-        
-        embedding_norm = embedding / np.linalg.norm(embedding)
-        current_index = self.index.ntotal
-        self.index.add(embedding_norm.reshape(1, -1))
-        
-        self.person_mappings[current_index] = {
-            'person_id': None,  # Will be set after DB insert
+            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            kpss = distance2kps(anchor_centers, kps_preds)
+            kpss = kpss.reshape((kpss.shape[0], -1, 2))
+            
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(bboxes[pos_inds])
+            kpss_list.append(kpss[pos_inds])
+        
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        bboxes = np.vstack(bboxes_list) / det_scale
+        kpss = np.vstack(kpss_list) / det_scale
+        
+        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)[order, :]
+        keep = det_model.nms(pre_det)
+        return pre_det[keep, :], kpss[order][keep]
+    
+    def _anchor_centers(self, height: int, width: int, stride: int) -> np.ndarray:
+        det_model = self.app.det_model
+        key = (height, width, stride)
+        
+        if key not in det_model.center_cache:
+            anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+            anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+            if det_model._num_anchors > 1:
+                anchor_centers = np.stack([anchor_centers] * det_model._num_anchors, axis=1).reshape((-1, 2))
+            det_model.center_cache[key] = anchor_centers
+            
+        return det_model.center_cache[key]
+    
+    def search_person(self, embedding: np.ndarray, user_id: int, threshold: float = 0.7) -> Optional[Dict]:
+        """Search the user's persons for a match to the face embedding"""
+        matches = self.search_persons(embedding, user_id, k=1, threshold=threshold)[0]
+        return matches[0] if matches else None
+    
+    def search_persons(self, embeddings: np.ndarray, user_id: int, k: int = 1, threshold: float = 0.7) -> List[List[Dict]]:
+        """Top-k matching persons for every row of an embedding matrix, best first.
+        
+        All rows are normalized in one step and searched with a single FAISS call.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+        if len(embeddings) == 0:
+            return []
+        
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        queries = embeddings / np.maximum(norms, 1e-12)
+        return self.index_manager.get(user_id).search_many(queries, k, threshold)
+    
+    def add_person(self, person_id: int, name: str, embeddings: np.ndarray, user_id: int, embedding_id: str):
+        """Add new person to the user's face index from one face or a matrix of faces"""
+        shard = self.index_manager.get(user_id)
+        shard.add(person_id, np.asarray(embeddings).reshape(-1, self.embedding_dim), {
+            'person_id': person_id,
             'name': name,
             'embedding_id': embedding_id,
             'user_id': user_id
-        }
-        
-        self.save_index()
-        return embedding_id
-    
-    def update_person_mapping(self, embedding_id: str, person_id: int):
-        """Update person mapping with database ID"""
-        for idx, mapping in self.person_mappings.items():
-            if mapping['embedding_id'] == embedding_id:
-                mapping['person_id'] = person_id
-                break
-        self.save_index()
-    
-    def delete_person(self, person_id: int):
-        """Remove person from face index"""
-        index_to_remove = None
-        for idx, mapping in self.person_mappings.items():
-            if mapping.get('person_id') == person_id:
-                index_to_remove = idx
-                break
-                
-        if index_to_remove is not None:
-            del self.person_mappings[index_to_remove]
-            self.rebuild_index()
-    
-    def update_person_embedding(self, person_id: int, new_embedding: np.ndarray):
-        """Update person embedding by averaging with new face (improves recognition)"""
-        for idx, mapping in self.person_mappings.items():
-            if mapping.get('person_id') == person_id:
-                # Get current embedding
-                current_embedding = self.index.reconstruct(idx)
-                
-                # Average with new embedding
-                new_embedding_norm = new_embedding / np.linalg.norm(new_embedding)
-                averaged = (current_embedding + new_embedding_norm) / 2
-                averaged = averaged / np.linalg.norm(averaged)
-                
-                # Update in index
-                self.index = self._replace_embedding_at_index(idx, averaged)
-                self.save_index()
-                break
-    
-    def _replace_embedding_at_index(self, idx: int, new_embedding: np.ndarray):
-        """Replace embedding at specific index"""
-        new_index = faiss.IndexFlatL2(self.embedding_dim)
-        new_mappings = {}
-        
-        for old_idx, mapping in self.person_mappings.items():
-            if old_idx < self.index.ntotal:
-                if old_idx == idx:
-                    embedding = new_embedding
-                else:
-                    embedding = self.index.reconstruct(old_idx)
-                
-                new_idx = new_index.ntotal
-                new_index.add(embedding.reshape(1, -1))
-                new_mappings[new_idx] = mapping
-        
-        self.person_mappings = new_mappings
-        return new_index
-    
-    def rebuild_index(self):
-        """Rebuild FAISS index after deletion"""
-        new_index = faiss.IndexFlatL2(self.embedding_dim)
-        new_mappings = {}
-        
-        for old_idx, mapping in self.person_mappings.items():
-            if old_idx < self.index.ntotal:
-                embedding = self.index.reconstruct(old_idx)
-                new_idx = new_index.ntotal
-                new_index.add(embedding.reshape(1, -1))
-                new_mappings[new_idx] = mapping
-        
-        self.index = new_index
-        self.person_mappings = new_mappings
-        self.save_index()
-    
-    def save_index(self):
-        """Save FAISS index and mappings"""
-        os.makedirs("./gallery_index", exist_ok=True)
-        faiss.write_index(self.index, "./gallery_index/person_embeddings.index")
-        
-        with open("./gallery_index/person_mappings.pkl", "wb") as f:
-            pickle.dump(self.person_mappings, f)
-    
-    def load_index(self):
-        """Load FAISS index and mappings"""
-        try:
-            if os.path.exists("./gallery_index/person_embeddings.index"):
-                self.index = faiss.read_index("./gallery_index/person_embeddings.index")
-                
-            if os.path.exists("./gallery_index/person_mappings.pkl"):
-                with open("./gallery_index/person_mappings.pkl", "rb") as f:
-                    self.person_mappings = pickle.load(f)
-        except Exception as e:
-            print(f"Error loading index: {e}")
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
-            self.person_mappings = {}
\ No newline at end of file
+        })
+        shard.save()
+    
+    def person_prototypes(self, person_ids: List[int], user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized prototype vectors of some persons, with the owning person id per row"""
+        return self.index_manager.get(user_id).prototypes_for(person_ids)
+    
+    def update_person_mapping(self, person_id: int, user_id: int, **fields):
+        """Update stored person details such as the name"""
+        shard = self.index_manager.get(user_id)
+        if shard.update_mapping(person_id, **fields):
+            shard.save()
+    
+    def delete_person(self, person_id: int, user_id: int):
+        """Remove person from the user's face index"""
+        shard = self.index_manager.get(user_id)
+        if shard.delete_person(person_id):
+            shard.save()
+    
+    def update_person_embedding(self, person_id: int, new_embedding: np.ndarray, user_id: int):
+        """Fold a newly labelled face into the person's prototypes (improves recognition)"""
+        shard = self.index_manager.get(user_id)
+        if shard.update_person_embedding(person_id, new_embedding):
+            shard.save()
+    
+    def update_person_embeddings(self, person_id: int, new_embeddings: np.ndarray, user_id: int):
+        """Fold many newly labelled faces into a person with one index update and one save"""
+        shard = self.index_manager.get(user_id)
+        if shard.update_person_embeddings(person_id, np.asarray(new_embeddings).reshape(-1, self.embedding_dim)):
+            shard.save()
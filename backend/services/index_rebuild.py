@@ -0,0 +1,121 @@
+"""Rebuild per-user face index shards from the Person and Face tables.
+
+The database is the source of truth; run this after a crash, a failed
+transaction or a model change left the index files out of step. From the
+backend folder:
+    python -m services.index_rebuild --user-id 42
+    python -m services.index_rebuild --all
+"""
+import argparse
+import os
+import time
+import numpy as np
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from connection import SessionLocal
+from models import Face, Person
+from services.face_index_manager import FaceIndexManager, UserFaceIndex
+from services.job_registry import job_registry
+from services.person_model import PersonModel
+from utils.embeddings import EMBEDDING_DIM, decode_embedding
+
+REBUILD_CHUNK_SIZE = int(os.getenv("FACE_INDEX_REBUILD_CHUNK_SIZE", "20000"))
+
+def _decode_chunk(blobs: List[bytes]) -> np.ndarray:
+    """Decode a chunk of stored embeddings into one matrix"""
+    if all(len(blob) == EMBEDDING_DIM * 4 for blob in blobs):
+        # Common case: a single frombuffer over the concatenated float32 rows
+        return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    return np.vstack([decode_embedding(blob) for blob in blobs]).astype(np.float32)
+
+def build_user_shard(db: Session, manager: FaceIndexManager, user_id: int, job_id: str = None) -> UserFaceIndex:
+    """Stream a user's labelled faces through a server-side cursor into a fresh shard"""
+    mappings = {person.id: {
+        'person_id': person.id,
+        'name': person.name,
+        'embedding_id': person.face_embedding_id,
+        'user_id': user_id
+    } for person in db.query(Person).filter(Person.user_id == user_id)}
+
+    stmt = select(Face.person_id, Face.embedding).join(Person, Face.person_id == Person.id).where(
+        Person.user_id == user_id
+    ).order_by(Face.person_id, Face.id).execution_options(yield_per=REBUILD_CHUNK_SIZE)
+
+    models: Dict[int, PersonModel] = {}
+    processed = 0
+    for rows in db.execute(stmt).partitions():
+        person_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        embeddings = _decode_chunk([row[1] for row in rows])
+
+        # Rows are sorted by person, so each person is one contiguous run of the chunk
+        starts = np.flatnonzero(np.r_[True, person_ids[1:] != person_ids[:-1]])
+        ends = np.r_[starts[1:], len(rows)]
+        for start, end in zip(starts, ends):
+            person_id = int(person_ids[start])
+            if person_id not in models:
+                models[person_id] = PersonModel(EMBEDDING_DIM)
+            models[person_id].add_faces(embeddings[start:end])
+
+        processed += len(rows)
+        if job_id:
+            job_registry.update(job_id, processed=processed)
+
+    # Persons without any face have nothing to match against
+    shard = manager.new_shard(user_id)
+    shard.load_models(models, {person_id: mappings[person_id] for person_id in models})
+    return shard
+
+def rebuild_user_index(manager: FaceIndexManager, user_id: int, job_id: str = None) -> Dict:
+    """Rebuild one user's shard from the database and swap it in"""
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        shard = manager.rebuild(user_id, lambda: build_user_shard(db, manager, user_id, job_id))
+        return {
+            'persons': len(shard.person_models),
+            'vectors': int(shard.index.ntotal),
+            'seconds': round(time.perf_counter() - start, 2)
+        }
+    finally:
+        db.close()
+
+def run_rebuild_job(job_id: str, user_id: int, manager: FaceIndexManager):
+    """Background entry point for an on-demand rebuild"""
+    job_registry.update(job_id, status='processing', processed=0)
+    try:
+        result = rebuild_user_index(manager, user_id, job_id)
+        job_registry.update(job_id, status='completed', **result)
+    except Exception as e:
+        print(f"Index rebuild job {job_id} failed: {e}")
+        job_registry.update(job_id, status='failed', error=str(e))
+
+def rebuild_all(manager: FaceIndexManager):
+    """Rebuild the shard of every user that has persons"""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(Person.user_id).distinct()]
+    finally:
+        db.close()
+
+    for user_id in user_ids:
+        result = rebuild_user_index(manager, user_id)
+        print(f"User {user_id}: {result['persons']} persons, {result['vectors']} vectors in {result['seconds']}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user-id", type=int)
+    target.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    manager = FaceIndexManager(EMBEDDING_DIM)
+    if args.all:
+        rebuild_all(manager)
+    else:
+        result = rebuild_user_index(manager, args.user_id)
+        print(f"User {args.user_id}: {result['persons']} persons, {result['vectors']} vectors in {result['seconds']}s")
+
+if __name__ == "__main__":
+    main()
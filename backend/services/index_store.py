@@ -0,0 +1,278 @@
+import base64
+import json
+import os
+import shutil
+import uuid
+import faiss
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process locking, so run a single API worker there
+    fcntl = None
+
+# Compact the write-ahead log into a fresh snapshot after this many records
+FACE_INDEX_SNAPSHOT_EVERY = int(os.getenv("FACE_INDEX_SNAPSHOT_EVERY", "1000"))
+# fsync every log record; turning this off trades the last few edits on power loss for speed
+FACE_INDEX_WAL_FSYNC = os.getenv("FACE_INDEX_WAL_FSYNC", "true").lower() == "true"
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_ARRAYS = ("centroids", "medoids", "weights")
+
+def encode_array(array: np.ndarray) -> Dict:
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return {'shape': list(array.shape), 'data': base64.b64encode(array.tobytes()).decode()}
+
+def decode_array(payload: Dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload['data']), dtype=np.float32).reshape(payload['shape'])
+
+def _fsync_dir(path: str):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _inode(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock shared by every process on this host"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+
+def _write_atomic(path: str, data: bytes):
+    """Write a small file so readers see either the old or the new content"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ShardStore:
+    """On-disk layout of one index shard: versioned snapshots plus a write-ahead log.
+
+    <dir>/CURRENT names the live snapshot directory (snap-<seq>-<id>), which holds
+    meta.json (persons and mappings), the prototype arrays as .npy files and
+    the optional ANN index. <dir>/wal.log holds one JSON record per line for
+    every change after that snapshot.
+
+    Several API workers can share a shard: writers take <dir>/LOCK, catch up
+    and then append, while every process notices a new CURRENT or a longer
+    log with two stat calls (poll) and reloads or tails accordingly.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.current_path = os.path.join(directory, "CURRENT")
+        self.wal_path = os.path.join(directory, "wal.log")
+        self.lock_path = os.path.join(directory, "LOCK")
+        self.seq = 0
+        self.pending = 0
+        self.wal = None
+        # What this process has seen: the CURRENT file, and how far into which log
+        self.snapshot_ino = None
+        self.wal_ino = None
+        self.wal_offset = 0
+        self.lock_depth = 0
+        self._lock = None
+
+    @contextmanager
+    def locked(self):
+        """Hold the shard's writer lock across processes; re-entrant for the shard lock holder"""
+        if self.lock_depth == 0:
+            self._lock = file_lock(self.lock_path)
+            self._lock.__enter__()
+        self.lock_depth += 1
+        try:
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0:
+                lock, self._lock = self._lock, None
+                lock.__exit__(None, None, None)
+
+    def poll(self) -> Optional[str]:
+        """'reload' when another process switched snapshots, 'tail' when the log changed, else None"""
+        if _inode(self.current_path) != self.snapshot_ino:
+            return 'reload'
+        try:
+            stat = os.stat(self.wal_path)
+        except FileNotFoundError:
+            return None
+        if stat.st_ino != self.wal_ino or stat.st_size != self.wal_offset:
+            return 'tail'
+        return None
+
+    def snapshot_name(self) -> Optional[str]:
+        if not os.path.exists(self.current_path):
+            return None
+        with open(self.current_path) as f:
+            return f.read().strip() or None
+
+    def read_snapshot(self) -> Optional[Dict]:
+        """Meta, memory-mapped arrays and ANN index of the live snapshot"""
+        # Taken before reading the name, so a switch in between shows up on the next poll
+        self.snapshot_ino = _inode(self.current_path)
+        # Re-read the log from the start; records the snapshot covers are skipped by seq
+        self.wal_ino = None
+        self.wal_offset = 0
+        self.pending = 0
+        self.seq = 0
+        name = self.snapshot_name()
+        if name is None:
+            return None
+
+        path = os.path.join(self.directory, name)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {meta.get('format')} in {path}")
+
+        snapshot = {'meta': meta, 'ann': None, 'name': name}
+        for key in SNAPSHOT_ARRAYS:
+            snapshot[key] = np.load(os.path.join(path, f"{key}.npy"), mmap_mode='r')
+        ann_path = os.path.join(path, "ann.index")
+        if os.path.exists(ann_path):
+            snapshot['ann'] = faiss.read_index(ann_path)
+
+        self.seq = meta['wal_seq']
+        return snapshot
+
+    def write_snapshot(self, meta: Dict, arrays: Dict[str, np.ndarray], ann=None):
+        """Write a complete snapshot, switch CURRENT to it and reset the log"""
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {**meta, 'format': SNAPSHOT_FORMAT, 'wal_seq': self.seq}
+        # Unique per write, so the live snapshot is never overwritten in place
+        name = f"snap-{self.seq:012d}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.directory, f"{name}.tmp")
+        os.makedirs(tmp_path)
+
+        try:
+            for key in SNAPSHOT_ARRAYS:
+                with open(os.path.join(tmp_path, f"{key}.npy"), "wb") as f:
+                    np.save(f, arrays[key])
+                    f.flush()
+                    os.fsync(f.fileno())
+            if ann is not None:
+                faiss.write_index(ann, os.path.join(tmp_path, "ann.index"))
+            with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_dir(tmp_path)
+
+            os.rename(tmp_path, os.path.join(self.directory, name))
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        # The snapshot only becomes live here; a crash before this keeps the old one plus the log
+        _write_atomic(self.current_path, name.encode())
+        _fsync_dir(self.directory)
+        self.snapshot_ino = _inode(self.current_path)
+
+        # Records up to wal_seq are inside the snapshot now
+        self._close_wal()
+        _write_atomic(self.wal_path, b"")
+        self.wal_ino = _inode(self.wal_path)
+        self.wal_offset = 0
+        self.pending = 0
+
+        for entry in os.listdir(self.directory):
+            if entry.startswith("snap-") and entry != name:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def replay(self) -> Iterator[Dict]:
+        """Yield log records not applied yet, stopping before an unfinished or torn tail"""
+        try:
+            f = open(self.wal_path, "rb")
+        except FileNotFoundError:
+            return
+
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if ino != self.wal_ino:
+                # A compaction replaced the log since we last read it
+                self.wal_ino = ino
+                self.wal_offset = 0
+            f.seek(self.wal_offset)
+
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Another process is mid-append, or crashed mid-append; the next writer truncates it
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"Ignoring corrupt records from offset {self.wal_offset} of {self.wal_path}")
+                    break
+                self.wal_offset += len(line)
+                if record['seq'] <= self.seq:
+                    continue
+                self.seq = record['seq']
+                self.pending += 1
+                yield record
+
+    def last_logged_seq(self) -> int:
+        """Highest sequence number in the log, so a fresh snapshot can supersede it"""
+        last = self.seq
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, "rb") as f:
+                for line in f:
+                    try:
+                        last = max(last, json.loads(line)['seq'])
+                    except ValueError:
+                        break
+        return last
+
+    def append(self, record: Dict):
+        """Durably log one change before it is acknowledged.
+
+        The caller holds locked() and has replayed the log, so seq continues
+        from the last record any process wrote.
+        """
+        if self.wal is not None and os.fstat(self.wal.fileno()).st_ino != self.wal_ino:
+            # Another process compacted; our handle points at the replaced log
+            self._close_wal()
+        if self.wal is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.wal = open(self.wal_path, "ab")
+            ino = os.fstat(self.wal.fileno()).st_ino
+            if ino != self.wal_ino:
+                self.wal_ino = ino
+                self.wal_offset = 0
+
+        if os.fstat(self.wal.fileno()).st_size != self.wal_offset:
+            # Drop a torn tail left by a crashed writer so the new record starts on its own line
+            self.wal.truncate(self.wal_offset)
+
+        data = json.dumps({**record, 'seq': self.seq + 1}).encode() + b"\n"
+        self.wal.write(data)
+        self.wal.flush()
+        if FACE_INDEX_WAL_FSYNC:
+            os.fsync(self.wal.fileno())
+        self.seq += 1
+        self.wal_offset += len(data)
+        self.pending += 1
+
+    def needs_compaction(self) -> bool:
+        return self.pending >= FACE_INDEX_SNAPSHOT_EVERY
+
+    def _close_wal(self):
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
@@ -0,0 +1,54 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class JobRegistry:
+    """In-memory registry of background jobs and their progress.
+
+    Jobs are only visible to the process that runs them, which is why the
+    API runs as a single uvicorn worker.
+    """
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, dict] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, kind: str, user_id: int, **fields) -> str:
+        """Register a new pending job and return its id"""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+
+        with self.lock:
+            self.jobs[job_id] = {
+                'id': job_id,
+                'kind': kind,
+                'user_id': user_id,
+                'status': 'pending',
+                'created_at': now,
+                'updated_at': now,
+                **fields
+            }
+            # Forget the oldest jobs once the registry is full
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """Update fields of an existing job"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                job['updated_at'] = time.time()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a snapshot of a job, or None if unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+job_registry = JobRegistry()
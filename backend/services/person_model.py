@@ -0,0 +1,74 @@
+import os
+import numpy as np
+
+# Medoids kept per person on top of the centroid
+PERSON_PROTOTYPES = int(os.getenv("FACE_PERSON_PROTOTYPES", "4"))
+# Index vector ids are person_id * PROTOTYPE_SLOTS + slot, slot 0 being the centroid
+PROTOTYPE_SLOTS = 16
+# A new face this close to a medoid only adds weight to it instead of becoming a prototype
+PROTOTYPE_MERGE_SIMILARITY = 0.8
+
+if not 1 <= PERSON_PROTOTYPES < PROTOTYPE_SLOTS:
+    raise ValueError(f"FACE_PERSON_PROTOTYPES must be between 1 and {PROTOTYPE_SLOTS - 1}, got {PERSON_PROTOTYPES}")
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+class PersonModel:
+    """Bounded set of prototypes for one person: a weighted centroid plus up to k medoids.
+
+    Every labelled face counts equally toward the centroid, and the medoids are
+    real faces kept far enough apart to cover different poses and ages.
+    """
+
+    def __init__(self, embedding_dim: int):
+        self.centroid_sum = np.zeros(embedding_dim, dtype=np.float32)
+        self.count = 0
+        self.medoids = np.zeros((0, embedding_dim), dtype=np.float32)
+        self.weights = np.zeros(0, dtype=np.int64)
+
+    def add_faces(self, embeddings: np.ndarray):
+        """Fold new faces into the centroid and the medoid set"""
+        for face in normalize_rows(embeddings).reshape(-1, len(self.centroid_sum)):
+            self.centroid_sum += face
+            self.count += 1
+
+            if len(self.medoids):
+                similarities = self.medoids @ face
+                best = int(np.argmax(similarities))
+                if similarities[best] >= PROTOTYPE_MERGE_SIMILARITY:
+                    self.weights[best] += 1
+                    continue
+
+            self.medoids = np.vstack([self.medoids, face])
+            self.weights = np.append(self.weights, 1)
+            if len(self.medoids) > PERSON_PROTOTYPES:
+                self._merge_closest_pair()
+
+    def _merge_closest_pair(self):
+        """Drop the lighter of the two most similar medoids, keeping its weight"""
+        similarities = self.medoids @ self.medoids.T
+        np.fill_diagonal(similarities, -np.inf)
+        i, j = np.unravel_index(int(np.argmax(similarities)), similarities.shape)
+        keep, drop = (i, j) if self.weights[i] >= self.weights[j] else (j, i)
+
+        self.weights[keep] += self.weights[drop]
+        self.medoids = np.delete(self.medoids, drop, axis=0)
+        self.weights = np.delete(self.weights, drop)
+
+    def centroid(self) -> np.ndarray:
+        return normalize_rows(self.centroid_sum)
+
+    def prototype_count(self) -> int:
+        return 1 if len(self.medoids) <= 1 else 1 + len(self.medoids)
+
+    def prototypes(self) -> np.ndarray:
+        """Centroid first, then the medoids once there is more than one mode to cover"""
+        if self.prototype_count() == 1:
+            return self.centroid().reshape(1, -1)
+        return np.vstack([self.centroid(), self.medoids])
+
+    @staticmethod
+    def vector_ids(person_id: int, count: int = PROTOTYPE_SLOTS) -> np.ndarray:
+        return np.arange(count, dtype=np.int64) + person_id * PROTOTYPE_SLOTS
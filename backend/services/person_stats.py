@@ -0,0 +1,48 @@
+from typing import Iterable, List
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Face, Person
+
+def lock_persons(db: Session, person_ids: Iterable[int]) -> List[Person]:
+    """Row-lock persons in id order for the rest of the transaction.
+
+    Writers that move faces call this before touching them, so two
+    transactions changing the same person queue up here instead of
+    deadlocking on face rows or committing stale stats.
+    """
+    person_ids = {person_id for person_id in person_ids if person_id is not None}
+    if not person_ids:
+        return []
+    return db.query(Person).filter(Person.id.in_(person_ids)).order_by(Person.id).with_for_update().all()
+
+def refresh_person_stats(db: Session, person_ids: Iterable[int]):
+    """Recompute photo_count and cover_face_id of persons whose faces changed; the caller commits.
+
+    Call after the face changes are flushed. Each person costs one range
+    scan of the (person_id, photo_id) index, so reads never have to count.
+    """
+    persons = lock_persons(db, person_ids)
+    if not persons:
+        return
+    person_ids = [person.id for person in persons]
+
+    # Locking reads see the latest committed faces, not this transaction's snapshot
+    stats = {person_id: (photo_count, first_face_id) for person_id, photo_count, first_face_id in db.query(
+        Face.person_id,
+        func.count(func.distinct(Face.photo_id)),
+        func.min(Face.id)
+    ).filter(Face.person_id.in_(person_ids)).group_by(Face.person_id).with_for_update(read=True)}
+
+    cover_ids = [person.cover_face_id for person in persons if person.cover_face_id]
+    cover_owners = dict(db.query(Face.id, Face.person_id).filter(
+        Face.id.in_(cover_ids)
+    ).with_for_update(read=True).all()) if cover_ids else {}
+
+    for person in persons:
+        photo_count, first_face_id = stats.get(person.id, (0, None))
+        person.photo_count = photo_count
+        # Keep the current cover while it still shows this person
+        if cover_owners.get(person.cover_face_id) != person.id:
+            person.cover_face_id = first_face_id
+    db.flush()
@@ -0,0 +1,29 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite file before connection.py reads the environment
+_db_dir = tempfile.mkdtemp(prefix="smartgallery-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.pop("DB_ASYNC_DRIVER", None)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, dropped again after the test"""
+    from connection import Base, SessionLocal, engine
+    # Importing the models registers their tables on Base
+    importlib.import_module("models")
+    
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
@@ -0,0 +1,48 @@
+"""Logins must never trade a stored password hash for a cheaper one"""
+import asyncio
+
+import pytest
+from jwcrypto import jwk
+from passlib.hash import argon2
+
+import utils.auth as auth
+from models import User
+from routes.auth import login
+from schemas.user import UserLogin
+
+PASSWORD = "correct horse battery staple"
+
+@pytest.fixture(autouse=True)
+def signing_key(monkeypatch):
+    monkeypatch.setattr(auth, "SIGNING_KEY", jwk.JWK.generate(kty="oct", size=256))
+
+def log_in(db, stored_hash: str) -> str:
+    user = User(email="login@example.com", full_name="Login", hashed_password=stored_hash, is_verified=True)
+    db.add(user)
+    db.commit()
+
+    token = asyncio.run(login(UserLogin(email=user.email, password=PASSWORD), db))
+    assert token["access_token"]
+    db.expire_all()
+    return db.get(User, user.id).hashed_password
+
+def test_default_cost_matches_passlib():
+    assert (auth.ARGON2_TIME_COST, auth.ARGON2_MEMORY_COST, auth.ARGON2_PARALLELISM) == (
+        argon2.default_rounds, argon2.memory_cost, argon2.parallelism
+    )
+
+def test_passlib_default_hash_is_kept_on_login(db):
+    stored = argon2.hash(PASSWORD)
+    assert auth.verify_and_update_password(PASSWORD, stored) == (True, None)
+    assert log_in(db, stored) == stored
+
+def test_weaker_hash_is_upgraded_on_login(db):
+    stored = argon2.using(rounds=1, memory_cost=512, parallelism=1).hash(PASSWORD)
+    upgraded = log_in(db, stored)
+
+    assert upgraded != stored
+    params = argon2.from_string(upgraded)
+    assert (params.rounds, params.memory_cost, params.parallelism) == (
+        argon2.default_rounds, argon2.memory_cost, argon2.parallelism
+    )
+    assert auth.verify_password(PASSWORD, upgraded)
@@ -0,0 +1,95 @@
+"""The batched SCRFD path must find exactly what SCRFD.detect finds one image at a time.
+
+The stock buffalo_l detector has a fixed batch axis, so this drives a fake
+ONNX session with a dynamic batch axis instead of a real model.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("insightface")
+pytest.importorskip("onnxruntime")
+
+from insightface.model_zoo.scrfd import SCRFD
+
+from services.gallery_face_service import GalleryFaceService
+
+INPUT_SIZE = (640, 640)
+STRIDES = [8, 16, 32]
+NUM_ANCHORS = 2
+
+class FakeSession:
+    """Nine SCRFD outputs (scores, boxes, keypoints per stride) derived from each image's pixels"""
+
+    def __init__(self, batch_dim):
+        self.batch_dim = batch_dim
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input.1", shape=[self.batch_dim, 3, "?", "?"])]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name=f"out{i}", shape=[1, "n", "c"]) for i in range(9)]
+
+    def run(self, output_names, feed):
+        blob = feed["input.1"]
+        self.batch_sizes.append(len(blob))
+        per_image = [self._outputs(image) for image in blob]
+        return [np.stack([outputs[i] for outputs in per_image]) for i in range(9)]
+
+    @staticmethod
+    def _outputs(image: np.ndarray) -> list:
+        rng = np.random.default_rng(int(np.abs(image).sum() * 1000) % 2 ** 32)
+        height, width = image.shape[1:]
+        scores, boxes, kps = [], [], []
+        for stride in STRIDES:
+            anchors = (height // stride) * (width // stride) * NUM_ANCHORS
+            score = rng.uniform(0, 0.45, (anchors, 1)).astype(np.float32)
+            # A handful of confident, partly overlapping candidates so NMS has work to do
+            score[rng.choice(anchors, 6, replace=False)] = rng.uniform(0.55, 0.99, (6, 1))
+            scores.append(score)
+            boxes.append(rng.uniform(0.5, 4, (anchors, 4)).astype(np.float32))
+            kps.append(rng.uniform(-2, 2, (anchors, 10)).astype(np.float32))
+        return scores + boxes + kps
+
+def make_detector(batch_dim) -> SCRFD:
+    detector = SCRFD(session=FakeSession(batch_dim))
+    detector.prepare(0, input_size=INPUT_SIZE, det_thresh=0.5)
+    return detector
+
+def make_service(detector: SCRFD) -> GalleryFaceService:
+    service = GalleryFaceService(load_index=False)
+    service._app = SimpleNamespace(det_model=detector, models={})
+    return service
+
+def make_images() -> list:
+    rng = np.random.default_rng(7)
+    # Landscape, portrait and square, so both letterbox branches are used
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for shape in [(480, 720, 3), (900, 400, 3), (640, 640, 3)]]
+
+def test_batched_decode_matches_scrfd_detect():
+    detector = make_detector("None")
+    service = make_service(detector)
+    images = make_images()
+    assert service._detector_supports_batch()
+
+    expected = [detector.detect(image, max_num=0, metric='default') for image in images]
+    detector.session.batch_sizes.clear()
+    batched = service._detect_batch(images)
+
+    # One inference call for the whole batch
+    assert detector.session.batch_sizes == [len(images)]
+    for (det, kpss), (expected_det, expected_kpss) in zip(batched, expected):
+        assert len(expected_det) > 0
+        np.testing.assert_allclose(det, expected_det, rtol=1e-5, atol=1e-3)
+        np.testing.assert_allclose(kpss, expected_kpss, rtol=1e-5, atol=1e-3)
+
+def test_fixed_batch_axis_falls_back_to_one_call_per_image():
+    detector = make_detector(1)
+    service = make_service(detector)
+    images = make_images()
+    assert not service._detector_supports_batch()
+
+    service._detect_batch(images)
+    assert detector.session.batch_sizes == [1] * len(images)
@@ -0,0 +1,86 @@
+"""Bulk and archive uploads keep their database round trips off the event loop"""
+import asyncio
+import io
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import event
+
+import routes.gallery as gallery
+from connection import engine
+from models import Photo, User
+from services.derivative_service import derivative_service
+from utils.auth import CurrentUser, get_current_user
+
+def jpeg(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(derivative_service, "cache_dir", str(tmp_path / "derivatives"))
+
+    user = User(email="bulk@example.com", full_name="Bulk", hashed_password="-", is_verified=True)
+    db.add(user)
+    db.commit()
+    principal = CurrentUser.from_user(user)
+
+    app = FastAPI()
+    app.include_router(gallery.router)
+    app.dependency_overrides[get_current_user] = lambda: principal
+    return TestClient(app)
+
+@pytest.fixture
+def statements_on_loop():
+    """SQL statements that ran on a thread with a running event loop"""
+    blocking = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        blocking.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield blocking
+    event.remove(engine, "before_cursor_execute", record)
+
+def test_bulk_upload_queries_run_in_the_threadpool(db, client, statements_on_loop):
+    files = [("files", (f"{color}.jpg", jpeg(color), "image/jpeg")) for color in ["red", "green", "red"]]
+    response = client.post("/gallery/upload/bulk", files=files)
+
+    assert response.status_code == 200
+    photos = response.json()['photos']
+    assert [photo['duplicate'] for photo in photos] == [False, False, True]
+    assert db.query(Photo).count() == 2
+    assert statements_on_loop == []
+
+def test_archive_upload_queries_run_in_the_threadpool(db, client, statements_on_loop):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for color in ["red", "blue"]:
+            zf.writestr(f"{color}.jpg", jpeg(color))
+    response = client.post("/gallery/upload/archive", files={"file": ("photos.zip", archive.getvalue(), "application/zip")})
+
+    assert response.status_code == 200
+    assert len(response.json()['photos']) == 2
+    assert db.query(Photo).count() == 2
+    assert statements_on_loop == []
+
+@pytest.mark.parametrize("warmup, expected", [("starting", "pending"), ("unavailable", "skipped")])
+def test_uploads_during_warm_up_wait_for_detection(db, client, monkeypatch, warmup, expected):
+    monkeypatch.setattr(gallery, "detection_queue", None)
+    monkeypatch.setitem(gallery.warmup_status, "status", warmup)
+
+    single = client.post("/gallery/upload", files={"file": ("red.jpg", jpeg("red"), "image/jpeg")})
+    bulk = client.post("/gallery/upload/bulk", files=[("files", ("blue.jpg", jpeg("blue"), "image/jpeg"))])
+
+    assert single.json()['faces_status'] == expected
+    assert bulk.json()['photos'][0]['faces_status'] == expected
+    assert {photo.faces_status for photo in db.query(Photo)} == {expected}
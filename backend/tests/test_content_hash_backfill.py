@@ -0,0 +1,38 @@
+from models import Photo, User
+from services.content_hash_backfill import backfill_content_hashes
+from utils.uploads import hash_file
+
+def test_backfill_hashes_old_photos_once_per_user(db, tmp_path):
+    red, blue = tmp_path / "red.jpg", tmp_path / "blue.jpg"
+    red.write_bytes(b"red pixels")
+    blue.write_bytes(b"blue pixels")
+
+    alice = User(email="alice@example.com", full_name="Alice", hashed_password="-")
+    bob = User(email="bob@example.com", full_name="Bob", hashed_password="-")
+    db.add_all([alice, bob])
+    db.flush()
+
+    def photo(user, path):
+        row = Photo(user_id=user.id, filename=path.name, original_name=path.name, file_path=str(path),
+                    file_size=1, faces_status="ready")
+        db.add(row)
+        db.flush()
+        return row
+
+    first, copy, other_user, other_file = photo(alice, red), photo(alice, red), photo(bob, red), photo(alice, blue)
+    missing = photo(alice, tmp_path / "gone.jpg")
+    db.commit()
+
+    assert backfill_content_hashes(chunk_size=2) == {'hashed': 3, 'duplicates': 1, 'missing': 1}
+
+    db.expire_all()
+    red_hash = hash_file(str(red))
+    assert db.get(Photo, first.id).content_hash == red_hash
+    # Only the oldest of Alice's identical photos may hold the hash
+    assert db.get(Photo, copy.id).content_hash is None
+    assert db.get(Photo, other_user.id).content_hash == red_hash
+    assert db.get(Photo, other_file.id).content_hash == hash_file(str(blue))
+    assert db.get(Photo, missing.id).content_hash is None
+
+    # Re-running finds nothing new to hash
+    assert backfill_content_hashes()['hashed'] == 0
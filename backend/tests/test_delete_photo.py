@@ -0,0 +1,62 @@
+"""Deleting the last photo of some content removes its original and every derivative"""
+import os
+
+import pytest
+from PIL import Image
+
+from models import Photo, User
+from routes.gallery import delete_photo
+from services.derivative_service import derivative_service
+from utils.auth import CurrentUser
+
+CONTENT_HASH = "ab" + "1" * 62
+OTHER_HASH = "ab" + "2" * 62
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(derivative_service, "cache_dir", str(tmp_path / "derivatives"))
+    return tmp_path / "derivatives"
+
+def make_user(db, email: str) -> CurrentUser:
+    user = User(email=email, full_name=email, hashed_password="-", is_verified=True)
+    db.add(user)
+    db.flush()
+    return CurrentUser.from_user(user)
+
+def make_photo(db, user: CurrentUser, path: str, content_hash: str) -> Photo:
+    photo = Photo(user_id=user.id, filename=os.path.basename(path), original_name="photo.jpg", file_path=path,
+                  file_size=os.path.getsize(path), content_hash=content_hash, faces_status="ready")
+    db.add(photo)
+    db.commit()
+    return photo
+
+def derivative_files(cache_dir, content_hash: str) -> list:
+    directory = cache_dir / content_hash[:2]
+    return sorted(name for name in os.listdir(directory) if name.startswith(content_hash)) if directory.exists() else []
+
+def test_derivatives_go_with_the_last_photo_of_their_content(db, tmp_path, cache_dir):
+    original = tmp_path / "blob.jpg"
+    other = tmp_path / "other.jpg"
+    Image.new("RGB", (600, 400), "red").save(original)
+    Image.new("RGB", (600, 400), "blue").save(other)
+
+    alice, bob = make_user(db, "alice@example.com"), make_user(db, "bob@example.com")
+    first = make_photo(db, alice, str(original), CONTENT_HASH)
+    second = make_photo(db, bob, str(original), CONTENT_HASH)
+    unrelated = make_photo(db, alice, str(other), OTHER_HASH)
+    for photo in (first, unrelated):
+        derivative_service.generate_thumbnails(photo.file_path, photo.content_hash)
+        derivative_service.generate_face_crops(photo.file_path, photo.content_hash, [(100, 100, 80, 80)])
+    kept = derivative_files(cache_dir, CONTENT_HASH)
+    assert kept
+
+    # Bob still has the same content, so the blob and its derivatives stay
+    delete_photo(first.id, db, alice)
+    assert original.exists()
+    assert derivative_files(cache_dir, CONTENT_HASH) == kept
+
+    delete_photo(second.id, db, bob)
+    assert not original.exists()
+    assert derivative_files(cache_dir, CONTENT_HASH) == []
+    # Files of other content in the same fan-out directory are untouched
+    assert derivative_files(cache_dir, OTHER_HASH)
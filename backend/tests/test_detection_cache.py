@@ -0,0 +1,21 @@
+import numpy as np
+
+from services.detection_cache import load_cached_detections, store_detections
+from utils.embeddings import EMBEDDING_DIM
+
+def test_cached_photo_without_faces_loads_as_empty(db):
+    store_detections(db, "0" * 64, [])
+    db.commit()
+
+    assert load_cached_detections(db, ["0" * 64]) == {"0" * 64: []}
+
+def test_cached_faces_round_trip(db):
+    embeddings = np.random.default_rng(0).random((2, EMBEDDING_DIM), dtype=np.float32)
+    faces = [{'bbox': {'x': i, 'y': 0, 'width': 10, 'height': 10}, 'confidence': 0.9, 'embedding': embedding}
+             for i, embedding in enumerate(embeddings)]
+    store_detections(db, "1" * 64, faces)
+    db.commit()
+
+    cached = load_cached_detections(db, ["1" * 64])["1" * 64]
+    assert [face['bbox']['x'] for face in cached] == [0, 1]
+    np.testing.assert_array_equal(np.vstack([face['embedding'] for face in cached]), embeddings)
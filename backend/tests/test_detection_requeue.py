@@ -0,0 +1,63 @@
+"""Detection interrupted by a restart is queued again, and saving results stays idempotent"""
+import asyncio
+
+import numpy as np
+
+from models import Face, Photo, User
+from services.face_detection_queue import FaceDetectionQueue
+from utils.embeddings import EMBEDDING_DIM
+
+class NoMatches:
+    def search_persons(self, embeddings, user_id, k, threshold):
+        return [[] for _ in embeddings]
+
+class RecordingQueue(FaceDetectionQueue):
+    """Records submitted jobs instead of starting worker processes"""
+
+    def __init__(self, **kwargs):
+        super().__init__(NoMatches(), **kwargs)
+        self.submitted = []
+
+    def submit(self, user_id, photos):
+        self.submitted.append((user_id, [photo_id for photo_id, _, _ in photos]))
+        return f"job-{len(self.submitted)}"
+
+def make_photos(db, statuses) -> list:
+    users = [User(email=f"user{i}@example.com", full_name="User", hashed_password="-") for i in range(2)]
+    db.add_all(users)
+    db.flush()
+    photos = [Photo(user_id=users[i % 2].id, filename=f"{i}.jpg", original_name=f"{i}.jpg", file_path=f"./missing/{i}.jpg",
+                    file_size=1, faces_status=status) for i, status in enumerate(statuses)]
+    db.add_all(photos)
+    db.commit()
+    return photos
+
+def test_requeue_picks_up_pending_and_processing_photos_per_user(db):
+    photos = make_photos(db, ['pending', 'processing', 'ready', 'failed', 'pending', 'pending', 'skipped', 'processing'])
+    queue = RecordingQueue(max_pending=2)
+
+    job_ids = asyncio.run(queue.requeue_unfinished())
+
+    user_a, user_b = photos[0].user_id, photos[1].user_id
+    # Batches never exceed the queue's capacity, and each job belongs to one user
+    assert queue.submitted == [
+        (user_a, [photos[0].id, photos[4].id]),
+        (user_b, [photos[1].id, photos[5].id]),
+        (user_b, [photos[7].id]),
+    ]
+    assert len(job_ids) == 3
+
+def test_saving_results_twice_stores_faces_once(db):
+    [photo] = make_photos(db, ['processing'])
+    queue = RecordingQueue()
+    faces = [{'bbox': {'x': 0, 'y': 0, 'width': 10, 'height': 10}, 'confidence': 0.9,
+              'embedding': np.ones(EMBEDDING_DIM, dtype=np.float32)}]
+
+    assert queue._save_results([photo.id], [faces], set())['faces_count'] == 1
+    # A second job for the same photo, e.g. a requeue racing a direct submit
+    queue._set_status([photo.id], 'processing')
+    assert queue._save_results([photo.id], [faces], set())['faces_count'] == 0
+
+    db.expire_all()
+    assert db.get(Photo, photo.id).faces_status == 'ready'
+    assert db.query(Face).filter(Face.photo_id == photo.id).count() == 1
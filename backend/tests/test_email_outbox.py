@@ -0,0 +1,113 @@
+"""EmailSender drain passes against a stub SMTP connection and the SQLite test database"""
+import smtplib
+from datetime import datetime, timedelta
+
+from models import EmailOutbox
+from services.email_outbox import (
+    EMAIL_LEASE_SECONDS, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS, EmailSender, queue_email
+)
+
+class StubConnection:
+    """Stands in for SMTPConnection; `failures` maps a recipient to the error its send raises"""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+        self.closed = 0
+
+    def send(self, msg):
+        error = self.failures.get(msg['To'])
+        if error is not None:
+            raise error
+        self.sent.append(msg['To'])
+
+    def close(self):
+        self.closed += 1
+
+def queue(db, *addresses) -> list:
+    emails = [queue_email(db, address, "Subject", "Body") for address in addresses]
+    db.commit()
+    return [email.id for email in emails]
+
+def outbox(db) -> dict:
+    db.expire_all()
+    return {row.to_address: row for row in db.query(EmailOutbox)}
+
+def test_drain_sends_the_batch_and_marks_rows_sent(db):
+    queue(db, "a@example.com", "b@example.com")
+    connection = StubConnection()
+
+    assert EmailSender(connection).drain_once() == 2
+
+    assert connection.sent == ["a@example.com", "b@example.com"]
+    rows = outbox(db)
+    assert {row.status for row in rows.values()} == {'sent'}
+    assert all(row.sent_at is not None and row.attempts == 0 for row in rows.values())
+    assert EmailSender(connection).drain_once() == 0
+
+def test_transient_failure_reschedules_with_backoff(db):
+    queue(db, "a@example.com", "b@example.com", "c@example.com")
+    connection = StubConnection({"b@example.com": smtplib.SMTPServerDisconnected("Connection lost")})
+    before = datetime.utcnow()
+
+    EmailSender(connection).drain_once()
+
+    rows = outbox(db)
+    assert rows["a@example.com"].status == 'sent'
+    failed = rows["b@example.com"]
+    assert failed.status == 'pending'
+    assert failed.attempts == 1
+    assert failed.last_error == "Connection lost"
+    assert failed.next_attempt_at >= before + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS)
+    # The rest of the batch is not tried over a broken connection, and waits just as long
+    untried = rows["c@example.com"]
+    assert untried.status == 'pending'
+    assert untried.attempts == 0
+    assert untried.next_attempt_at == failed.next_attempt_at
+    assert connection.closed == 1
+    assert connection.sent == ["a@example.com"]
+
+    # Not due yet, so the next pass claims nothing
+    assert EmailSender(StubConnection()).drain_once() == 0
+
+def test_permanent_failure_marks_row_failed_and_continues(db):
+    queue(db, "gone@example.com", "b@example.com")
+    refused = smtplib.SMTPRecipientsRefused({"gone@example.com": (550, b"No such user")})
+    connection = StubConnection({"gone@example.com": refused})
+
+    EmailSender(connection).drain_once()
+
+    rows = outbox(db)
+    assert rows["gone@example.com"].status == 'failed'
+    assert rows["gone@example.com"].attempts == 1
+    assert rows["b@example.com"].status == 'sent'
+    assert connection.closed == 0
+
+def test_transient_failure_gives_up_after_max_attempts(db):
+    [email_id] = queue(db, "a@example.com")
+    db.get(EmailOutbox, email_id).attempts = EMAIL_MAX_ATTEMPTS - 1
+    db.commit()
+
+    EmailSender(StubConnection({"a@example.com": smtplib.SMTPServerDisconnected("Connection lost")})).drain_once()
+
+    row = outbox(db)["a@example.com"]
+    assert row.status == 'failed'
+    assert row.attempts == EMAIL_MAX_ATTEMPTS
+
+def test_rows_stuck_in_sending_are_requeued_once_their_lease_expires(db):
+    stuck_id, leased_id = queue(db, "stuck@example.com", "leased@example.com")
+    now = datetime.utcnow()
+    # A sender died holding the first row; another one still holds the second
+    for email_id, lease_ends in [(stuck_id, now - timedelta(seconds=1)), (leased_id, now + timedelta(seconds=EMAIL_LEASE_SECONDS))]:
+        row = db.get(EmailOutbox, email_id)
+        row.status = 'sending'
+        row.next_attempt_at = lease_ends
+    db.commit()
+
+    connection = StubConnection()
+    assert EmailSender(connection).drain_once() == 1
+
+    assert connection.sent == ["stuck@example.com"]
+    rows = outbox(db)
+    assert rows["stuck@example.com"].status == 'sent'
+    assert rows["leased@example.com"].status == 'sending'
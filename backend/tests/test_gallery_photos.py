@@ -0,0 +1,102 @@
+"""GET /gallery/photos: constant query count per page and gap-free keyset pagination"""
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from connection import engine
+from models import Face, Person, Photo, User
+from routes.gallery import get_photos
+from utils.auth import CurrentUser
+
+def make_user(db, email: str) -> CurrentUser:
+    user = User(email=email, full_name=email, hashed_password="-", is_verified=True)
+    db.add(user)
+    db.flush()
+    return CurrentUser.from_user(user)
+
+def make_photos(db, user_id: int, count: int, person: Person = None, created_at=None) -> list:
+    photos = []
+    for i in range(count):
+        photo = Photo(user_id=user_id, filename=f"{user_id}-{i}.jpg", original_name=f"{i}.jpg",
+                      file_path=f"./uploads/{user_id}-{i}.jpg", file_size=1, faces_count=2,
+                      faces_status="ready", content_hash=f"{user_id:032x}{i:032x}",
+                      created_at=created_at(i) if created_at else None)
+        for _ in range(2):
+            photo.faces.append(Face(bbox_x=0, bbox_y=0, bbox_width=10, bbox_height=10,
+                                    confidence=0.9, embedding=b"\0" * 2048, person=person))
+        photos.append(photo)
+    db.add_all(photos)
+    db.flush()
+    return photos
+
+def make_person(db, user_id: int, name: str, photo_count: int) -> Person:
+    person = Person(user_id=user_id, name=name, face_embedding_id=f"{user_id}-{name}", photo_count=photo_count)
+    db.add(person)
+    db.flush()
+    return person
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+def list_photos(db, user: CurrentUser, **params) -> dict:
+    return asyncio.run(get_photos(db=db, current_user=user, **{'person_id': None, 'cursor': None, 'limit': 50, **params}))
+
+@pytest.mark.parametrize("by_person", [False, True])
+def test_query_count_does_not_grow_with_page_size(db, by_person):
+    small = make_user(db, "small@example.com")
+    large = make_user(db, "large@example.com")
+    small_person = make_person(db, small.id, "Ada", 1)
+    large_person = make_person(db, large.id, "Bob", 50)
+    make_photos(db, small.id, 1, person=small_person)
+    make_photos(db, large.id, 50, person=large_person)
+    db.commit()
+
+    counts = {}
+    for user, person, expected in [(small, small_person, 1), (large, large_person, 50)]:
+        db.expire_all()
+        params = {'person_id': person.id} if by_person else {}
+        with count_queries() as statements:
+            page = list_photos(db, user, **params)
+        assert len(page['photos']) == expected
+        assert page['total'] == expected
+        assert all(face['person']['id'] == person.id for photo in page['photos'] for face in photo['faces'])
+        counts[expected] = len(statements)
+
+    # Total, the page itself, then faces with their persons for the whole page
+    assert counts[1] == counts[50] == 3
+
+def test_cursor_pages_cover_every_photo_once_when_timestamps_tie(db):
+    user = make_user(db, "ties@example.com")
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    # Five photos share each timestamp, so pages must break ties on id
+    photos = make_photos(db, user.id, 48, created_at=lambda i: base + timedelta(seconds=i // 5))
+    db.commit()
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = list_photos(db, user, cursor=cursor, limit=7)
+        seen.extend(photo['id'] for photo in page['photos'])
+        pages += 1
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert pages == 7
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == sorted(photo.id for photo in photos)
+
+    expected_order = [p.id for p in sorted(photos, key=lambda p: (p.created_at, p.id), reverse=True)]
+    assert seen == expected_order
@@ -0,0 +1,27 @@
+import pytest
+from pydantic import ValidationError
+
+from schemas.gallery import FaceAssignRequest, FaceBulkAssignRequest
+
+def test_bulk_assign_accepts_existing_person():
+    request = FaceBulkAssignRequest(face_ids=[1, 2], person_id=7)
+    assert request.person_id == 7
+    assert request.new_person_name is None
+
+def test_bulk_assign_accepts_new_person():
+    request = FaceBulkAssignRequest(face_ids=[1], new_person_name="Ada")
+    assert request.new_person_name == "Ada"
+
+@pytest.mark.parametrize("target", [{}, {"person_id": 7, "new_person_name": "Ada"}])
+def test_bulk_assign_requires_exactly_one_target(target):
+    with pytest.raises(ValidationError):
+        FaceBulkAssignRequest(face_ids=[1], **target)
+
+@pytest.mark.parametrize("target", [{}, {"person_id": 7, "new_person_name": "Ada"}, {"new_person_name": ""}])
+def test_single_assign_requires_exactly_one_target(target):
+    with pytest.raises(ValidationError):
+        FaceAssignRequest(**target)
+
+def test_gallery_routes_import():
+    import routes.gallery
+    assert any(route.path == "/gallery/faces/assign" for route in routes.gallery.router.routes)
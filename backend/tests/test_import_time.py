@@ -0,0 +1,45 @@
+"""Importing the API must stay cheap; the model runtimes load in the warm-up thread.
+
+Each run imports main in a fresh interpreter, so nothing is cached between
+runs. IMPORT_TIME_BUDGET (seconds) overrides the median budget on slow machines.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the detection workers and the warm-up thread, never while importing the app
+DEFERRED_MODULES = ["insightface", "onnxruntime", "cv2", "torch"]
+# FastAPI and SQLAlchemy alone take about half a second on a slow runner; InsightFace adds several
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3.0"))
+RUNS = 3
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'loaded': [name for name in {DEFERRED_MODULES!r} if name in sys.modules]
+}}))
+"""
+
+def import_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    # The app may print while importing; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def test_import_main_defers_model_runtimes_and_stays_within_budget():
+    results = [import_once() for _ in range(RUNS)]
+    
+    loaded = sorted({name for result in results for name in result['loaded']})
+    assert not loaded, f"Imported eagerly by main: {', '.join(loaded)}"
+    
+    median = statistics.median(result['seconds'] for result in results)
+    assert median <= IMPORT_TIME_BUDGET, f"import main took {median:.3f}s, budget is {IMPORT_TIME_BUDGET:.2f}s"
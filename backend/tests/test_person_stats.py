@@ -0,0 +1,88 @@
+"""Stored photo_count and cover_face_id must match the faces after every kind of write"""
+import numpy as np
+from fastapi import BackgroundTasks
+from sqlalchemy import func
+
+from models import Face, Person, Photo, User
+from routes.gallery import assign_faces_to_person, delete_photo
+from schemas.gallery import FaceBulkAssignRequest
+from services.face_detection_queue import FaceDetectionQueue
+from services.face_rematch import rematch_faces
+from utils.auth import CurrentUser
+from utils.embeddings import EMBEDDING_DIM
+
+def unit(axis: int) -> np.ndarray:
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    vector[axis] = 1
+    return vector
+
+class StubFaceService:
+    """Recognises any embedding pointing along axis 0 as `person_id`"""
+
+    def __init__(self, person_id: int, name: str):
+        self.person_id = person_id
+        self.name = name
+
+    def search_persons(self, embeddings, user_id, k, threshold):
+        return [[{'person_id': self.person_id, 'name': self.name, 'similarity': 0.99}] if embedding[0] > 0.5 else []
+                for embedding in embeddings]
+
+def assert_stats_current(db, user_id: int):
+    db.expire_all()
+    live = dict(db.query(Face.person_id, func.count(func.distinct(Face.photo_id))).filter(
+        Face.person_id.isnot(None)
+    ).group_by(Face.person_id).all())
+    for person in db.query(Person).filter(Person.user_id == user_id):
+        assert person.photo_count == live.get(person.id, 0), person.name
+        if person.photo_count:
+            assert db.get(Face, person.cover_face_id).person_id == person.id
+        else:
+            assert person.cover_face_id is None
+
+def face_data(embedding: np.ndarray) -> dict:
+    return {'bbox': {'x': 0, 'y': 0, 'width': 10, 'height': 10}, 'confidence': 0.9, 'embedding': embedding}
+
+def test_person_stats_follow_detection_assign_rematch_and_delete(db):
+    user = User(email="stats@example.com", full_name="Stats", hashed_password="-", is_verified=True)
+    db.add(user)
+    db.flush()
+    current_user = CurrentUser.from_user(user)
+
+    ada = Person(user_id=user.id, name="Ada", face_embedding_id="ada")
+    bob = Person(user_id=user.id, name="Bob", face_embedding_id="bob")
+    photos = [Photo(user_id=user.id, filename=f"{i}.jpg", original_name=f"{i}.jpg", file_path=f"./missing/{i}.jpg",
+                    file_size=1, faces_status="pending") for i in range(4)]
+    db.add_all([ada, bob, *photos])
+    db.commit()
+
+    # Detection: two photos of Ada are recognised, the other faces stay unassigned
+    queue = FaceDetectionQueue(StubFaceService(ada.id, ada.name))
+    queue._save_results([p.id for p in photos], [
+        [face_data(unit(0)), face_data(unit(1))],
+        [face_data(unit(0))],
+        [face_data(unit(2))],
+        [face_data(unit(2)), face_data(unit(3))]
+    ], set())
+    assert_stats_current(db, user.id)
+    assert db.get(Person, ada.id).photo_count == 2
+
+    # Assign: one of Ada's faces and two unassigned ones move to Bob
+    ada_face = db.query(Face).filter(Face.person_id == ada.id, Face.photo_id == photos[0].id).one()
+    loose = db.query(Face).filter(Face.person_id.is_(None), Face.photo_id.in_([photos[2].id, photos[3].id])).all()
+    assign_faces_to_person(
+        FaceBulkAssignRequest(face_ids=[ada_face.id, *[face.id for face in loose[:2]]], person_id=bob.id),
+        BackgroundTasks(), db, current_user
+    )
+    assert_stats_current(db, user.id)
+    assert db.get(Person, ada.id).cover_face_id != ada_face.id
+
+    # Rematch: the remaining unassigned faces along axis 1 join Ada
+    assert rematch_faces(db, user.id, unit(1)[None, :], np.array([ada.id]))['matched'] == 1
+    assert_stats_current(db, user.id)
+
+    # Delete: every photo goes, and both persons end up with nothing
+    for photo in photos:
+        delete_photo(photo.id, db, current_user)
+        assert_stats_current(db, user.id)
+    assert db.get(Person, ada.id).photo_count == 0
+    assert db.get(Person, bob.id).photo_count == 0
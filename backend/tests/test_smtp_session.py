@@ -0,0 +1,124 @@
+"""SMTPConnection and EmailSender against a real SMTP session served by aiosmtpd"""
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+
+from aiosmtpd.controller import Controller
+
+import utils.email
+from models import EmailOutbox
+from services.email_outbox import EmailSender, queue_email
+from utils.email import SMTPConnection, build_message
+
+class RecordingHandler:
+    """Accepts mail except for recipients listed in `refuse`, which get that reply at RCPT"""
+
+    def __init__(self):
+        self.refuse = {}
+        self.received = []
+        self.peers = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return self.refuse[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        self.peers.add(session.peer)
+        return "250 OK"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class SMTPServer:
+    def __init__(self):
+        self.handler = RecordingHandler()
+        self.port = free_port()
+        self.controller = None
+
+    def start(self):
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def stop(self):
+        self.controller.stop()
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    monkeypatch.setattr(utils.email, "EMAIL_ADDRESS", "noreply@example.com")
+    server = SMTPServer()
+    server.start()
+    yield server
+    server.stop()
+
+def connect(server: SMTPServer) -> SMTPConnection:
+    return SMTPConnection("127.0.0.1", server.port, starttls=False, username="", password="")
+
+def test_messages_share_one_session(smtp_server):
+    connection = connect(smtp_server)
+    for i in range(3):
+        connection.send(build_message(f"user{i}@example.com", "Subject", "Body"))
+    connection.close()
+
+    assert smtp_server.handler.received == [f"user{i}@example.com" for i in range(3)]
+    assert len(smtp_server.handler.peers) == 1
+
+def test_reconnects_after_the_server_drops_the_session(smtp_server):
+    connection = connect(smtp_server)
+    connection.send(build_message("before@example.com", "Subject", "Body"))
+
+    # A server restart closes the kept-alive session under the client
+    smtp_server.stop()
+    smtp_server.start()
+    connection.send(build_message("after@example.com", "Subject", "Body"))
+    connection.close()
+
+    assert smtp_server.handler.received == ["before@example.com", "after@example.com"]
+    assert len(smtp_server.handler.peers) == 2
+
+def test_sender_retries_transient_refusals_and_fails_permanent_ones(db, smtp_server):
+    smtp_server.handler.refuse = {
+        "gone@example.com": "550 No such user",
+        "busy@example.com": "451 Try again later",
+    }
+    for address in ["ok@example.com", "gone@example.com", "busy@example.com", "waiting@example.com"]:
+        queue_email(db, address, "Subject", "Body")
+    db.commit()
+
+    sender = EmailSender(connect(smtp_server))
+    assert sender.drain_once() == 4
+
+    db.expire_all()
+    rows = {row.to_address: row for row in db.query(EmailOutbox)}
+    assert rows["ok@example.com"].status == 'sent'
+    assert rows["gone@example.com"].status == 'failed'
+    # A 4xx refusal is retried later, and the rest of the batch waits with it
+    assert rows["busy@example.com"].status == 'pending'
+    assert rows["busy@example.com"].attempts == 1
+    assert rows["busy@example.com"].next_attempt_at > datetime.utcnow()
+    assert rows["waiting@example.com"].status == 'pending'
+    assert smtp_server.handler.received == ["ok@example.com"]
+
+    # Once the retry is due and the server accepts again, both go out over a fresh session
+    smtp_server.handler.refuse = {}
+    for address in ["busy@example.com", "waiting@example.com"]:
+        rows[address].next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert sender.drain_once() == 2
+    sender.connection.close()
+
+    db.expire_all()
+    assert {row.to_address: row.status for row in db.query(EmailOutbox)} == {
+        "ok@example.com": 'sent',
+        "gone@example.com": 'failed',
+        "busy@example.com": 'sent',
+        "waiting@example.com": 'sent',
+    }
+    assert smtp_server.handler.received == ["ok@example.com", "busy@example.com", "waiting@example.com"]
@@ -1,11 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from passlib.hash import argon2
 from jwcrypto import jwt, jwk
 from datetime import datetime, timedelta
+import asyncio
 import random
 import string
 import os
 import json
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
@@ -16,9 +23,38 @@ load_dotenv()
 JWT_KEY = os.getenv("JWT_KEY")
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# Parsed once; a missing key only fails when a token is issued or checked
+SIGNING_KEY = jwk.JWK.from_json(JWT_KEY) if JWT_KEY else None
+
+# Verified tokens are remembered until they expire, but no longer than the TTL,
+# so changes to a user reach every worker within AUTH_CACHE_TTL seconds
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Unset values keep passlib's defaults (3 passes, 64 MiB, 4 lanes). Logins rehash stored
+# passwords to whatever is configured, so lowering these weakens every account that signs in
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", str(argon2.default_rounds)))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(argon2.memory_cost)))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", str(argon2.parallelism)))
+
+# Hashing runs on its own threads so a login burst can't stall the event loop;
+# beyond PASSWORD_HASH_MAX_PENDING queued calls, requests are shed with a 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM
+)
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+# Only touched from the event loop
+_hash_pending = 0
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -30,8 +66,33 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         print(f"Password verification failed: {e}")
         return False
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash when the stored one uses outdated parameters"""
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception as e:
+        print(f"Password verification failed: {e}")
+        return False, None
+
+async def run_password_hasher(func, *args):
+    """Run a hashing call on the bounded password executor, shedding load when it is full"""
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Too many sign-in requests, please retry shortly", headers={"Retry-After": "1"})
+    
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+def _signing_key() -> jwk.JWK:
+    if SIGNING_KEY is None:
+        raise RuntimeError("JWT_KEY is not configured")
+    return SIGNING_KEY
+
 def create_access_token(data: dict):
-    key = jwk.JWK.from_json(JWT_KEY)
+    key = _signing_key()
     
     header = {"alg": "HS256"}
     payload = {
@@ -46,33 +107,73 @@ def create_access_token(data: dict):
 def generate_otp() -> str:
     return ''.join(random.choices(string.digits, k=6))
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    from models import User
-    
+class CurrentUser:
+    """The authenticated user as routes see it, without a database session attached"""
+
+    def __init__(self, id: int, email: str, full_name: str, is_verified: bool, created_at: datetime):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.is_verified = is_verified
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user) -> "CurrentUser":
+        return cls(user.id, user.email, user.full_name, user.is_verified, user.created_at)
+
+_principal_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_principal_cache_lock = threading.Lock()
+
+def _cached_principal(token: str):
+    with _principal_cache_lock:
+        entry = _principal_cache.get(token)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if time.time() >= expires_at:
+            del _principal_cache[token]
+            return None
+        _principal_cache.move_to_end(token)
+        return principal
+
+def _cache_principal(token: str, principal: CurrentUser, exp):
+    expires_at = time.time() + AUTH_CACHE_TTL
+    if exp:
+        expires_at = min(expires_at, exp)
+    with _principal_cache_lock:
+        _principal_cache[token] = (principal, expires_at)
+        _principal_cache.move_to_end(token)
+        while len(_principal_cache) > AUTH_CACHE_SIZE:
+            _principal_cache.popitem(last=False)
+
+def decode_access_token(token: str) -> dict:
+    """Verify the signature and expiry of a token and return its claims"""
     try:
-        print(f"Received token: {token[:50]}...")  # Debug log
-        print(f"JWT_KEY: {JWT_KEY[:50]}...")  # Debug log
-        
-        key = jwk.JWK.from_json(JWT_KEY)
-        token_obj = jwt.JWT(jwt=token, key=key)
-        claims = json.loads(token_obj.claims)
-        
-        print(f"Claims: {claims}")  # Debug log
-        
-        email: str = claims.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid token - no email")
-            
-        # Check expiration
-        exp = claims.get("exp")
-        if exp and datetime.utcnow().timestamp() > exp:
-            raise HTTPException(status_code=401, detail="Token expired")
-            
+        claims = json.loads(jwt.JWT(jwt=token, key=_signing_key()).claims)
     except Exception as e:
-        print(f"Token verification error: {e}")  # Debug log
         raise HTTPException(status_code=401, detail=f"Invalid token: {str(e)}")
     
-    user = db.query(User).filter(User.email == email).first()
+    if claims.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token - no email")
+    
+    exp = claims.get("exp")
+    if exp and datetime.utcnow().timestamp() > exp:
+        raise HTTPException(status_code=401, detail="Token expired")
+    return claims
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> CurrentUser:
+    """Resolve the bearer token, from the cache when it was verified recently"""
+    from models import User
+    
+    principal = _cached_principal(token)
+    if principal is not None:
+        return principal
+    
+    claims = decode_access_token(token)
+    user = db.query(User).filter(User.email == claims["sub"]).first()
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
\ No newline at end of file
+    
+    principal = CurrentUser.from_user(user)
+    _cache_principal(token, principal, claims.get("exp"))
+    return principal
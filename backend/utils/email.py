@@ -1,4 +1,5 @@
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
@@ -7,32 +8,78 @@ from dotenv import load_dotenv
 load_dotenv()
 
 SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT"))
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Off for local stand-in servers such as aiosmtpd that don't speak TLS
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+# Servers drop idle sessions; reconnecting after this is cheaper than a failed send
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
 
-def send_otp_email(to_email: str, otp_code: str):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = to_email
-        msg['Subject'] = "Verify Your Email - OTP Code"
-        
-        body = f"""
+def otp_email(otp_code: str):
+    """Subject and body of the verification email"""
+    body = f"""
         Your OTP verification code is: {otp_code}
-        
+
         This code will expire in 10 minutes.
         """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
\ No newline at end of file
+    return "Verify Your Email - OTP Code", body
+
+def build_message(to_email: str, subject: str, body: str, from_email: str = None) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = from_email or EMAIL_ADDRESS
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+class SMTPConnection:
+    """One authenticated SMTP session, reused across messages and reopened when it drops"""
+
+    def __init__(self, host: str = None, port: int = None, starttls: bool = None,
+                 username: str = None, password: str = None, idle_timeout: int = SMTP_IDLE_TIMEOUT):
+        self.host = host or SMTP_SERVER
+        self.port = port or SMTP_PORT
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.username = EMAIL_ADDRESS if username is None else username
+        self.password = EMAIL_PASSWORD if password is None else password
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def send(self, msg):
+        """Send one message, reconnecting once if the kept-alive session was dropped"""
+        if self.server is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+
+        if self.server is None:
+            self._connect()
+            self.server.send_message(msg)
+        else:
+            try:
+                self.server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                self._connect()
+                self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                self.server.close()
+            self.server = None
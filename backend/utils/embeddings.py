@@ -0,0 +1,15 @@
+import os
+import numpy as np
+
+EMBEDDING_DIM = 512
+# float16 halves storage again at a small precision cost
+EMBEDDING_DTYPE = np.dtype(os.getenv("FACE_EMBEDDING_DTYPE", "float32"))
+
+def encode_embedding(embedding) -> bytes:
+    """Pack an embedding into the binary column format"""
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """Read-only view over a stored embedding, the dtype follows from the blob size"""
+    dtype = np.float16 if len(data) == EMBEDDING_DIM * 2 else np.float32
+    return np.frombuffer(data, dtype=dtype)
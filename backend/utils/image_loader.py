@@ -0,0 +1,51 @@
+import io
+import os
+import numpy as np
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+
+# JPEGs are decoded at the smallest DCT scale whose shorter side still covers this
+# (the detector input and the largest thumbnail both fit inside it)
+IMAGE_DECODE_SIZE = int(os.getenv("IMAGE_DECODE_SIZE", "1024"))
+
+EXIF_ORIENTATION = 0x0112
+# Orientations 5-8 rotate by 90 degrees and swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def oriented_size(img: Image.Image) -> Tuple[int, int]:
+    """Width and height as displayed, read from the header without decoding pixels"""
+    width, height = img.size
+    if img.getexif().get(EXIF_ORIENTATION, 1) in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+class DecodedImage:
+    """A photo decoded once and shared by dimensions, face detection and thumbnails"""
+
+    def __init__(self, image: Image.Image, width: int, height: int):
+        self.image = image
+        self.width = width
+        self.height = height
+
+    @property
+    def scale(self) -> float:
+        """Decoded size relative to the full-size photo (1.0 unless draft decoding kicked in)"""
+        return self.image.width / self.width
+
+    def detection_input(self) -> np.ndarray:
+        """BGR pixel array in the layout InsightFace expects"""
+        return np.ascontiguousarray(np.asarray(self.image)[:, :, ::-1])
+
+def decode_image(data: bytes, max_size: Optional[int] = IMAGE_DECODE_SIZE) -> DecodedImage:
+    """Decode in-memory image bytes once, upright and in RGB"""
+    with Image.open(io.BytesIO(data)) as src:
+        width, height = oriented_size(src)
+        if max_size:
+            # Only JPEG honours draft(); a square request keeps both sides >= max_size
+            src.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(src)
+        image.load()
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return DecodedImage(image, width, height)
@@ -0,0 +1,133 @@
+import hashlib
+import itertools
+import os
+import tarfile
+import uuid
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from PIL import Image
+
+from utils.image_loader import oriented_size
+
+CHUNK_SIZE = 1024 * 1024
+MAX_PHOTO_SIZE = 100 * 1024 * 1024
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff'}
+
+def is_image_name(name: str) -> bool:
+    base = os.path.basename(name)
+    # Skip macOS resource forks such as __MACOSX/._IMG_0001.jpg
+    return not base.startswith('._') and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+def blob_name(content_hash: str, original_name: str) -> str:
+    """Upload-relative path of the content-addressed file for these bytes"""
+    ext = os.path.splitext(original_name)[1].lower()
+    # Two-level fan-out keeps directories small on large libraries
+    return f"{content_hash[:2]}/{content_hash}{ext}"
+
+def _publish_blob(tmp_path: str, upload_dir: str, filename: str) -> str:
+    """Move a fully written temp file to its content address, dropping it if already stored"""
+    file_path = os.path.join(upload_dir, filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if os.path.exists(file_path):
+        # Same hash means same bytes, so the existing blob is shared
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, file_path)
+    return file_path
+
+def write_blob(content: bytes, content_hash: str, original_name: str, upload_dir: str) -> Tuple[str, str]:
+    """Store in-memory bytes content-addressed and return (filename, file_path)"""
+    filename = blob_name(content_hash, original_name)
+    if os.path.exists(os.path.join(upload_dir, filename)):
+        return filename, os.path.join(upload_dir, filename)
+
+    tmp_path = os.path.join(upload_dir, f"{uuid.uuid4()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        return filename, _publish_blob(tmp_path, upload_dir, filename)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def hash_file(path: str) -> str:
+    """sha256 of a stored file, read in chunks like save_stream hashes uploads"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_stream(stream: BinaryIO, original_name: str, upload_dir: str) -> Dict:
+    """Copy a file-like object to the upload folder in chunks, hashing as it writes.
+
+    The file ends up content-addressed, so identical uploads share one copy.
+    """
+    tmp_path = os.path.join(upload_dir, f"{uuid.uuid4()}.tmp")
+
+    digest = hashlib.sha256()
+    file_size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > MAX_PHOTO_SIZE:
+                    raise ValueError(f"{original_name} is larger than {MAX_PHOTO_SIZE} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+
+        # Only the header is parsed here, pixels are decoded later by the detector
+        try:
+            with Image.open(tmp_path) as img:
+                width, height = oriented_size(img)
+        except:
+            width, height = None, None
+
+        content_hash = digest.hexdigest()
+        filename = blob_name(content_hash, original_name)
+        file_path = _publish_blob(tmp_path, upload_dir, filename)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        'filename': filename,
+        'original_name': os.path.basename(original_name),
+        'file_path': file_path,
+        'file_size': file_size,
+        'content_hash': content_hash,
+        'width': width,
+        'height': height
+    }
+
+def iter_archive_images(fileobj: BinaryIO, upload_dir: str) -> Iterator[Dict]:
+    """Save every image inside a zip or tar archive, yielding the saved file info"""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image_name(info.filename) or info.file_size > MAX_PHOTO_SIZE:
+                    continue
+                with archive.open(info) as member:
+                    yield save_stream(member, info.filename, upload_dir)
+    else:
+        fileobj.seek(0)
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if not member.isfile() or not is_image_name(member.name) or member.size > MAX_PHOTO_SIZE:
+                    continue
+                stream = archive.extractfile(member)
+                if stream is None:
+                    continue
+                with stream:
+                    yield save_stream(stream, member.name, upload_dir)
+
+def take(iterator: Iterator, count: int) -> List:
+    """Pull up to `count` items from an iterator"""
+    return list(itertools.islice(iterator, count))
@@ -7,6 +7,11 @@ import axios from 'axios'
 
 const API_URL = 'http://localhost:8000'
 
+// Resized copy when available, photos uploaded before thumbnails existed fall back to the original
+const photoUrl = (photo, width) => photo.content_hash
+  ? `${API_URL}/gallery/thumbnails/${photo.content_hash}?width=${width}`
+  : `${API_URL}/uploads/${photo.filename}`
+
 export default function GalleryPage() {
   const [photos, setPhotos] = useState([])
   const [persons, setPersons] = useState([])
@@ -56,15 +61,30 @@ export default function GalleryPage() {
 
     try {
       const token = localStorage.getItem('token')
-      await axios.post(`${API_URL}/gallery/upload`, formData, { headers: { Authorization: `Bearer ${token}` } })
+      const res = await axios.post(`${API_URL}/gallery/upload`, formData, { headers: { Authorization: `Bearer ${token}` } })
       loadPhotos()
-      loadPersons()
+      if (res.data.job_id) waitForFaces(res.data.job_id)
     } catch (err) {
       alert('Upload failed')
     }
     setLoading(false)
   }
 
+  const waitForFaces = async (jobId) => {
+    const token = localStorage.getItem('token')
+    for (let attempt = 0; attempt < 60; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, 2000))
+      try {
+        const res = await axios.get(`${API_URL}/gallery/jobs/${jobId}`, { headers: { Authorization: `Bearer ${token}` } })
+        if (res.data.status === 'completed' || res.data.status === 'failed') break
+      } catch (err) {
+        break
+      }
+    }
+    loadPhotos()
+    loadPersons()
+  }
+
   const handleAssignFace = async () => {
     try {
       const token = localStorage.getItem('token')
@@ -126,7 +146,7 @@ export default function GalleryPage() {
           photos.map(photo => (
             <Grid item xs={12} sm={6} md={4} lg={3} key={photo.id}>
               <Card sx={{ cursor: 'pointer', position: 'relative' }}>
-                <CardMedia component="img" height="200" image={`${API_URL}/uploads/${photo.filename}`} onClick={() => setSelectedPhoto(photo)} />
+                <CardMedia component="img" height="200" image={photoUrl(photo, 512)} onClick={() => setSelectedPhoto(photo)} />
                 <IconButton
                   onClick={(e) => { e.stopPropagation(); handleDeletePhoto(photo.id); }}
                   sx={{ position: 'absolute', top: 8, right: 8, bgcolor: 'rgba(255,255,255,0.8)', '&:hover': { bgcolor: 'rgba(255,0,0,0.8)', color: 'white' } }}
@@ -134,7 +154,7 @@ export default function GalleryPage() {
                   <Close />
                 </IconButton>
                 <Box sx={{ p: 1 }}>
-                  <Typography variant="caption">{photo.faces_count} faces</Typography>
+                  <Typography variant="caption">{photo.faces_status === 'pending' || photo.faces_status === 'processing' ? 'Detecting faces...' : `${photo.faces_count} faces`}</Typography>
                   <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 0.5, mt: 1 }}>
                     {photo.faces?.filter(f => f.person).map(f => (
                       <Chip key={f.id} label={f.person.name} size="small" />
@@ -161,7 +181,7 @@ export default function GalleryPage() {
           {selectedPhoto && (
             <>
               <Box sx={{ position: 'relative', mb: 2 }}>
-                <img src={`${API_URL}/uploads/${selectedPhoto.filename}`} style={{ width: '100%' }} />
+                <img src={photoUrl(selectedPhoto, 1024)} style={{ width: '100%' }} />
                 {showNames && selectedPhoto.faces?.map(face => (
                   <Box
                     key={face.id}